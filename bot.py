@@ -1,17 +1,37 @@
 import asyncio
 import logging
+import queue
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
 from typing import Optional, List, Dict
 import os
 import calendar
 import shutil
-
-from aiogram import Bot, Dispatcher, F, Router
+from functools import lru_cache
+
+from aiohttp import ClientError, web
+from aiogram import BaseMiddleware, Bot, Dispatcher, F, Router
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+try:
+    import uvloop  # более быстрый цикл событий; под Windows недоступен
+except ImportError:
+    uvloop = None
+try:
+    import orjson  # быстрый разбор и сборка JSON запросов к Bot API
+except ImportError:
+    orjson = None
 from aiogram.types import (
     Message,
     CallbackQuery,
@@ -27,17 +47,39 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не найден в переменных среды")
 
+# Вебхук: если задан WEBHOOK_URL, Telegram сам присылает апдейты, иначе работаем через long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный https-адрес бота, например https://bot.example.com
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+TELEGRAM_REQUEST_TIMEOUT = 30  # секунд на запрос (для getUpdates добавляется POLLING_TIMEOUT)
+# Сбросить накопившиеся апдейты при старте. По умолчанию выключено:
+# после перезапуска бот обрабатывает всё, что пришло, пока он был выключен
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "0") == "1"
+POLLING_TIMEOUT = 25  # секунд ожидания в getUpdates (по умолчанию в aiogram 10)
+# Хранилище состояний FSM: с REDIS_URL диалоги переживают перезапуск бота, иначе - память процесса
+REDIS_URL = os.getenv("REDIS_URL")  # например redis://localhost:6379/0
+
 OFFICE_MAP_PATH = "office_map.png"
 TOTAL_PLACES = 13
+PLACE_NAMES = {i: f"Место №{i}" for i in range(1, TOTAL_PLACES + 1)}
+DB_POOL_SIZE = 4
+DB_MAX_CONCURRENCY = DB_POOL_SIZE + 1  # читатели + писатель
+DB_CACHED_STATEMENTS = 256  # подготовленных выражений на соединение (по умолчанию 128)
+READ_CACHE_TTL = 10  # секунд; кэш чтений сбрасывается и при любой записи
+READ_CACHE_SIZE = 256
+CALENDAR_DEBOUNCE = 1.0  # секунд; повторный календарь по двойному нажатию не отправляем
 
 # ID главного администратора ("мама бота")
 SUPER_ADMIN_ID = 528599224
 
 # ID администраторов (загружаются из БД при старте)
-ADMIN_IDS = [SUPER_ADMIN_ID]
+ADMIN_IDS = frozenset({SUPER_ADMIN_ID})
 
 # Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# LOG_LEVEL=WARNING в продакшене отключает info-логи на каждом клике
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 
@@ -90,19 +132,203 @@ class AdminStates(StatesGroup):
     extend_permanent_confirm = State()
 
 
+# Состояния, в которых админ работает с бронями другого пользователя (target_user_id)
+TARGET_USER_STATES = frozenset({
+    AdminStates.selecting_user_booking.state,
+    AdminStates.change_for_user_date.state,
+    AdminStates.view_permanent_user.state,
+    AdminStates.delete_permanent_select.state,
+})
+
+# Переход после выбора даты в календаре: текущее состояние -> выбор места
+DATE_SELECTED_NEXT_STATE = {
+    BookingStates.waiting_for_date.state: BookingStates.waiting_for_place,
+    ChangeStates.waiting_for_new_date.state: ChangeStates.waiting_for_new_place,
+    AdminStates.booking_for_user_date.state: AdminStates.booking_for_user_place,
+    AdminStates.change_for_user_place.state: AdminStates.change_for_user_confirm,
+}
+
+# Состояния просмотра постоянных броней (в календаре только постоянные даты)
+PERMANENT_VIEW_STATES = frozenset({
+    AdminStates.view_permanent_user.state,
+    AdminStates.delete_permanent_select.state,
+})
+
+
+# Запросы, которые выполняются в циклах и на каждом шаге бронирования: один и тот же
+# текст SQL попадает в кэш подготовленных выражений соединения и не разбирается заново
+SQL_HAS_USER_BOOKING = """
+    SELECT 1 FROM bookings
+    WHERE user_id = ? AND booking_date = ? AND status = 'active'
+    LIMIT 1
+"""
+
+SQL_FREE_PLACES_ON_DATE = """
+    SELECT id FROM places
+    WHERE id NOT IN (
+        SELECT place_id FROM bookings
+        WHERE booking_date = ? AND status = 'active'
+    )
+"""
+
+# Проверка "место свободно и у пользователя нет брони" и вставка - одним запросом
+# OR IGNORE: при гонке за место срабатывает uq_active_place_date
+SQL_CREATE_BOOKING = """
+    INSERT OR IGNORE INTO bookings (user_id, place_id, booking_date, status)
+    SELECT ?, ?, ?, 'active'
+    WHERE NOT EXISTS (
+        SELECT 1 FROM bookings
+        WHERE user_id = ? AND status = 'active' AND booking_date = ?
+    ) AND NOT EXISTS (
+        SELECT 1 FROM bookings
+        WHERE place_id = ? AND booking_date = ? AND status = 'active'
+    )
+"""
+
+# Места, у которых дата постоянной брони отменена
+SQL_PERMANENT_CANCELLED_ON_DATE = """
+    SELECT DISTINCT place_id FROM bookings
+    WHERE booking_date = ? AND status = 'cancelled' AND booking_type = 'permanent'
+"""
+
+# Дата постоянной брони вставляется, только если место на эту дату ещё свободно
+SQL_INSERT_PERMANENT_DATE = """
+    INSERT INTO bookings (user_id, place_id, booking_date, status, booking_type, permanent_booking_id)
+    SELECT ?, ?, ?, 'active', 'permanent', ?
+    WHERE NOT EXISTS (
+        SELECT 1 FROM bookings
+        WHERE place_id = ? AND booking_date = ? AND status = 'active'
+    )
+"""
+
+
+@lru_cache(maxsize=512)
+def parse_date(date_str: str) -> date:
+    """DD.MM.YYYY -> date; strptime медленный, а даты в запросах повторяются"""
+    return datetime.strptime(date_str, "%d.%m.%Y").date()
+
+
+@lru_cache(maxsize=512)
+def to_db_date(date_str: str) -> str:
+    """Дата интерфейса DD.MM.YYYY -> YYYY-MM-DD, в котором даты хранятся в БД"""
+    return parse_date(date_str).isoformat()
+
+
+def weekdays_to_mask(weekdays) -> int:
+    """Дни недели -> битовая маска weekdays_mask (бит i - день i)"""
+    return sum(1 << day for day in set(weekdays))
+
+
+def mask_to_weekdays(mask: int) -> List[int]:
+    """Битовая маска weekdays_mask -> отсортированный список дней недели"""
+    return [day for day in range(7) if mask & (1 << day)]
+
+
+# В БД даты в ISO (сортируются и сравниваются как строки), наружу отдаём DD.MM.YYYY
+SQL_DISPLAY_DATE = "strftime('%d.%m.%Y', booking_date)"
+
+
+def _with_place_name(row: sqlite3.Row) -> Dict:
+    """Строка брони -> dict с названием места (без JOIN на places)"""
+    booking = dict(row)
+    booking['place_name'] = PLACE_NAMES[booking['place_id']]
+    return booking
+
+
 # База данных
 class Database:
-    def __init__(self, db_path: str = "office_booking.db"):
+    def __init__(self, db_path: str = "office_booking.db", pool_size: int = DB_POOL_SIZE):
         self.db_path = db_path
+        # День недели (0-6) -> места, занятые постоянными бронями
+        self.permanent_by_weekday: List[frozenset] = [frozenset()] * 7
+        # Кэш чтений: ключ -> (поколение, истекает, значение); поколение растёт при любой записи
+        self._generation = 0
+        self._generation_lock = threading.Lock()
+        self._read_cache: Dict[tuple, tuple] = {}
+        # Долгоживущие соединения: одно для записи (SQLite всё равно пишет по одному)
+        # и пул только для чтения - в WAL читатели не ждут писателя
+        self._writer = self._connect()
+        self._writer_lock = threading.Lock()
         self.init_db()
-
-    def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        self._readers = queue.Queue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._readers.put(self._connect(readonly=True))
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        if readonly:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False,
+                                   cached_statements=DB_CACHED_STATEMENTS)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                   cached_statements=DB_CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        # Эти PRAGMA действуют только на текущее соединение
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-64000")  # ~64 МБ кэша страниц на соединение
+        conn.execute("PRAGMA mmap_size=134217728")
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """Соединение для записи (commit при успехе, rollback при ошибке)"""
+        with self._writer_lock:
+            conn = self._writer
+            changes_before = conn.total_changes
+            try:
+                with conn:
+                    yield conn
+            finally:
+                if conn.total_changes != changes_before:
+                    with self._generation_lock:
+                        self._generation += 1
+                        self._read_cache.clear()
+
+    @contextmanager
+    def reader(self):
+        """Взять соединение только для чтения из пула"""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def _cache_get(self, key: tuple):
+        """Значение из кэша чтений или None, если после него была запись или истёк срок"""
+        # dict.get атомарен, блокировка не нужна: устаревшую запись отсекает сравнение поколений
+        cached = self._read_cache.get(key)
+        if cached is not None and cached[0] == self._generation and cached[1] > time.monotonic():
+            return cached[2]
+        return None
+
+    def _cache_put(self, key: tuple, generation: int, value):
+        # Поколение берётся до запроса: если запись успеет пройти во время него,
+        # сохранённый результат сразу окажется устаревшим
+        # Под той же блокировкой, что и сброс кэша в writer(): вызывается из потоков run_db
+        with self._generation_lock:
+            if key not in self._read_cache and len(self._read_cache) >= READ_CACHE_SIZE:
+                # Словарь хранит порядок вставки - вытесняем самую старую запись (FIFO)
+                self._read_cache.pop(next(iter(self._read_cache)))
+            self._read_cache[key] = (generation, time.monotonic() + READ_CACHE_TTL, value)
+
+    def close(self):
+        """Закрыть все соединения"""
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        # Собрать статистику планировщика по таблицам, где она нужна (рекомендация SQLite)
+        self._writer.execute("PRAGMA optimize")
+        self._writer.close()
 
     def init_db(self):
-        with self.get_connection() as conn:
+        with self.writer() as conn:
             cursor = conn.cursor()
 
+            # WAL сохраняется в файле БД: читатели не блокируются записью
+            cursor.execute("PRAGMA journal_mode=WAL")
+
+            # Схема, миграции и начальные данные - одной транзакцией (PRAGMA выше - вне её)
+            cursor.execute("BEGIN")
+
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS users (
                     telegram_id INTEGER PRIMARY KEY,
@@ -143,6 +369,7 @@ class Database:
                     user_id INTEGER NOT NULL,
                     place_id INTEGER NOT NULL,
                     weekdays TEXT NOT NULL,
+                    weekdays_mask INTEGER NOT NULL DEFAULT 0,
                     status TEXT DEFAULT 'active',
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     created_by INTEGER NOT NULL,
@@ -176,215 +403,261 @@ class Database:
                 logger.info("Migrating database: adding permanent_booking_id column")
                 cursor.execute("ALTER TABLE bookings ADD COLUMN permanent_booking_id INTEGER")
 
-            cursor.execute("SELECT COUNT(*) FROM places")
-            if cursor.fetchone()[0] == 0:
-                for i in range(1, TOTAL_PLACES + 1):
-                    cursor.execute(
-                        "INSERT INTO places (id, name, description) VALUES (?, ?, ?)",
-                        (i, f"Место №{i}", f"Рабочее место номер {i}")
-                    )
+            try:
+                cursor.execute("SELECT weekdays_mask FROM permanent_bookings LIMIT 1")
+            except sqlite3.OperationalError:
+                logger.info("Migrating database: adding weekdays_mask column")
+                cursor.execute("ALTER TABLE permanent_bookings ADD COLUMN weekdays_mask INTEGER NOT NULL DEFAULT 0")
+
+                # Заполняем weekdays_mask по строке weekdays; битые значения пропускаем
+                cursor.execute("SELECT id, weekdays FROM permanent_bookings")
+                masks = []
+                for pb_id, weekdays_str in cursor.fetchall():
+                    days = [int(d) for d in (weekdays_str or "").split(',') if d.strip().isdigit() and int(d) < 7]
+                    if not days:
+                        logger.warning("Permanent booking %s has invalid weekdays %r, weekdays_mask left at 0",
+                                       pb_id, weekdays_str)
+                        continue
+                    masks.append((weekdays_to_mask(days), pb_id))
+                cursor.executemany("UPDATE permanent_bookings SET weekdays_mask = ? WHERE id = ?", masks)
+
+            # МИГРАЦИЯ: даты броней DD.MM.YYYY -> YYYY-MM-DD
+            cursor.execute("""
+                UPDATE bookings
+                SET booking_date = substr(booking_date, 7, 4) || '-' || substr(booking_date, 4, 2)
+                                   || '-' || substr(booking_date, 1, 2)
+                WHERE booking_date LIKE '__.__.____'
+            """)
+            if cursor.rowcount:
+                logger.info("Migrated %s booking dates to ISO format", cursor.rowcount)
+
+            # Индексы для частых запросов по броням
+            # place_id в индексе: свободные места на дату выбираются без чтения таблицы
+            cursor.execute("DROP INDEX IF EXISTS idx_bookings_date_status")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_bookings_date_status_place
+                ON bookings(booking_date, status, place_id)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_bookings_user_status
+                ON bookings(user_id, status, booking_date)
+            """)
+            # Отмена будущих дат при удалении/продлении постоянной брони
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_bookings_permanent
+                ON bookings(permanent_booking_id) WHERE status = 'active'
+            """)
+            # Поиск пользователя по username без учёта регистра
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_username_lower
+                ON users(LOWER(username))
+            """)
 
-            # Добавляем главного админа в таблицу admins, если его там нет
-            cursor.execute("SELECT COUNT(*) FROM admins WHERE telegram_id = ?", (SUPER_ADMIN_ID,))
-            if cursor.fetchone()[0] == 0:
-                cursor.execute(
-                    "INSERT OR IGNORE INTO admins (telegram_id, added_by) VALUES (?, ?)",
-                    (SUPER_ADMIN_ID, SUPER_ADMIN_ID)
+            # Одно место - одна активная бронь на дату
+            try:
+                cursor.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS uq_active_place_date
+                    ON bookings(place_id, booking_date) WHERE status = 'active'
+                """)
+            except sqlite3.IntegrityError:
+                logger.warning("Duplicate active bookings found, uq_active_place_date index not created")
+
+            cursor.execute("SELECT 1 FROM places LIMIT 1")
+            if cursor.fetchone() is None:
+                cursor.executemany(
+                    "INSERT INTO places (id, name, description) VALUES (?, ?, ?)",
+                    [(i, name, f"Рабочее место номер {i}") for i, name in PLACE_NAMES.items()]
                 )
 
+            # Добавляем главного админа в таблицу admins, если его там нет
+            cursor.execute(
+                "INSERT OR IGNORE INTO admins (telegram_id, added_by) VALUES (?, ?)",
+                (SUPER_ADMIN_ID, SUPER_ADMIN_ID)
+            )
+
             conn.commit()
+            self._reload_permanent_weekdays(cursor)
+
+    def _reload_permanent_weekdays(self, cursor: sqlite3.Cursor):
+        """Перестроить таблицу день недели -> места постоянных броней"""
+        cursor.execute("""
+            SELECT place_id, weekdays_mask FROM permanent_bookings
+            WHERE status = 'active'
+        """)
+        by_weekday = [set() for _ in range(7)]
+        for place_id, mask in cursor.fetchall():
+            for day in mask_to_weekdays(mask):
+                by_weekday[day].add(place_id)
+        self.permanent_by_weekday = [frozenset(places) for places in by_weekday]
 
     def add_user(self, telegram_id: int, username: str, first_name: str):
-        with self.get_connection() as conn:
+        with self.writer() as conn:
             cursor = conn.cursor()
+            # Для вернувшегося пользователя без изменений строка не перезаписывается
             cursor.execute("""
-                INSERT OR REPLACE INTO users (telegram_id, username, first_name)
+                INSERT INTO users (telegram_id, username, first_name)
                 VALUES (?, ?, ?)
+                ON CONFLICT(telegram_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name
+                WHERE username IS NOT excluded.username
+                   OR first_name IS NOT excluded.first_name
             """, (telegram_id, username or "", first_name or ""))
             conn.commit()
 
     def has_user_booking_on_date(self, user_id: int, date: str) -> bool:
-        with self.get_connection() as conn:
+        with self.reader() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) FROM bookings
-                WHERE user_id = ? AND booking_date = ? AND status = 'active'
-            """, (user_id, date))
-            return cursor.fetchone()[0] > 0
+            cursor.execute(SQL_HAS_USER_BOOKING, (user_id, to_db_date(date)))
+            return cursor.fetchone() is not None
 
     def get_available_places(self, date: str) -> List[int]:
-        weekday = datetime.strptime(date, "%d.%m.%Y").weekday()
+        generation = self._generation
+        cached = self._cache_get(("available", date))
+        if cached is not None:
+            return list(cached)
 
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+        with self.reader() as conn:
+            available = self._query_available_places(conn.cursor(), date)
 
-            # Получаем занятые места из обычных броней
-            cursor.execute("""
-                SELECT place_id FROM bookings
-                WHERE booking_date = ? AND status = 'active'
-            """, (date,))
-            booked = [row[0] for row in cursor.fetchall()]
+        self._cache_put(("available", date), generation, available)
+        return list(available)
 
-            # Получаем места из постоянных броней на этот день недели
-            cursor.execute("""
-                SELECT place_id FROM permanent_bookings
-                WHERE status = 'active' AND weekdays LIKE ?
-            """, (f'%{weekday}%',))
-            permanent_candidates = [row[0] for row in cursor.fetchall()]
-
-            # 🔥 ИСПРАВЛЕНИЕ: Проверяем, не отменена ли конкретная дата
-            # Для каждого места из постоянных броней проверяем,
-            # есть ли отменённая бронь на эту дату
-            permanent_booked = []
-            for place_id in permanent_candidates:
-                cursor.execute("""
-                    SELECT COUNT(*) FROM bookings
-                    WHERE place_id = ? 
-                      AND booking_date = ? 
-                      AND booking_type = 'permanent'
-                      AND status = 'cancelled'
-                """, (place_id, date))
+    def fetch_date_context(self, user_id: Optional[int], date: str) -> tuple:
+        """Есть ли у пользователя бронь на дату и свободные места - за одно соединение.
+        При user_id=None проверка брони пропускается."""
+        generation = self._generation
+        cached = self._cache_get(("available", date))
 
-                # Если нет отменённой брони - место занято постоянной бронью
-                if cursor.fetchone()[0] == 0:
-                    permanent_booked.append(place_id)
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            if user_id is not None:
+                cursor.execute(SQL_HAS_USER_BOOKING, (user_id, to_db_date(date)))
+                if cursor.fetchone() is not None:
+                    # Места этому пользователю уже не нужны
+                    return True, []
 
-        available = []
-        for place_id in range(1, TOTAL_PLACES + 1):
-            # Проверяем занятость
-            if place_id not in booked and place_id not in permanent_booked:
-                available.append(place_id)
+            if cached is not None:
+                return False, list(cached)
+            available = self._query_available_places(cursor, date)
 
-        return available
+        self._cache_put(("available", date), generation, available)
+        return False, list(available)
 
-    def create_booking(self, user_id: int, place_id: int, date: str) -> bool:
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+    def _query_available_places(self, cursor: sqlite3.Cursor, date: str) -> tuple:
+        weekday = parse_date(date).weekday()
+        db_date = to_db_date(date)
 
-            cursor.execute("""
-                SELECT COUNT(*) FROM bookings
-                WHERE user_id = ? AND booking_date = ? AND status = 'active'
-            """, (user_id, date))
+        # Свободные от активных броней места - разность множеств на стороне SQLite
+        cursor.execute(SQL_FREE_PLACES_ON_DATE, (db_date,))
+        not_booked = {row[0] for row in cursor.fetchall()}
 
-            if cursor.fetchone()[0] > 0:
-                return False
+        # Места из постоянных броней на этот день недели; уже занятые
+        # разовой бронью проверять не нужно
+        permanent_candidates = self.permanent_by_weekday[weekday] & not_booked
 
-            cursor.execute("""
-                SELECT COUNT(*) FROM bookings
-                WHERE place_id = ? AND booking_date = ? AND status = 'active'
-            """, (place_id, date))
+        # 🔥 ИСПРАВЛЕНИЕ: Проверяем, не отменена ли конкретная дата.
+        # Отменённые даты всех мест берём одним запросом: место без
+        # отменённой брони занято постоянной бронью
+        if permanent_candidates:
+            cursor.execute(SQL_PERMANENT_CANCELLED_ON_DATE, (db_date,))
+            permanent_booked = permanent_candidates - {row[0] for row in cursor.fetchall()}
+            not_booked -= permanent_booked
 
-            if cursor.fetchone()[0] > 0:
-                return False
+        return tuple(sorted(not_booked))
 
-            try:
-                cursor.execute("""
-                    INSERT INTO bookings (user_id, place_id, booking_date, status)
-                    VALUES (?, ?, ?, 'active')
-                """, (user_id, place_id, date))
-                conn.commit()
-                return True
-            except:
-                return False
+    def create_booking(self, user_id: int, place_id: int, date: str) -> bool:
+        with self.writer() as conn:
+            cursor = conn.cursor()
+            db_date = to_db_date(date)
+            cursor.execute(SQL_CREATE_BOOKING, (user_id, place_id, db_date, user_id, db_date, place_id, db_date))
+            conn.commit()
+            return cursor.rowcount == 1
 
     def get_user_bookings(self, user_id: int) -> List[Dict]:
-        with self.get_connection() as conn:
+        generation = self._generation
+        cached = self._cache_get(("user", user_id))
+        if cached is not None:
+            return [dict(b) for b in cached]
+
+        with self.reader() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT b.id, b.place_id, b.booking_date, p.name, b.booking_type, b.permanent_booking_id
+            cursor.execute(f"""
+                SELECT b.id, b.place_id, {SQL_DISPLAY_DATE} AS date,
+                       COALESCE(b.booking_type, 'regular') AS booking_type, b.permanent_booking_id
                 FROM bookings b
-                JOIN places p ON b.place_id = p.id
                 WHERE b.user_id = ? AND b.status = 'active'
                 ORDER BY b.booking_date
             """, (user_id,))
+            bookings = tuple(_with_place_name(row) for row in cursor.fetchall())
 
-            bookings = []
-            for row in cursor.fetchall():
-                booking_type = row[4] if row[4] else 'regular'
-                bookings.append({
-                    'id': row[0],
-                    'place_id': row[1],
-                    'date': row[2],
-                    'place_name': row[3],
-                    'booking_type': booking_type,
-                    'permanent_booking_id': row[5]
-                })
-            return bookings
+        self._cache_put(("user", user_id), generation, bookings)
+        return [dict(b) for b in bookings]
 
-    def cancel_booking(self, booking_id: int, user_id: int) -> bool:
-        with self.get_connection() as conn:
+    def cancel_booking_returning(self, booking_id: int, user_id: Optional[int] = None) -> Optional[Dict]:
+        """Отменить бронь и вернуть её (user_id=None - отмена админом без проверки владельца)"""
+        with self.writer() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
+            cursor.execute(f"""
                 UPDATE bookings
                 SET status = 'cancelled'
-                WHERE id = ? AND user_id = ? AND status = 'active'
-            """, (booking_id, user_id))
+                WHERE id = ? AND status = 'active' AND (? IS NULL OR user_id = ?)
+                RETURNING id, user_id, place_id, {SQL_DISPLAY_DATE} AS date
+            """, (booking_id, user_id, user_id))
+            row = cursor.fetchone()
             conn.commit()
-            return cursor.rowcount > 0
+            return _with_place_name(row) if row else None
 
     def get_booking_by_id(self, booking_id: int) -> Optional[Dict]:
-        with self.get_connection() as conn:
+        with self.reader() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT b.id, b.user_id, b.place_id, b.booking_date, p.name
+            cursor.execute(f"""
+                SELECT b.id, b.user_id, b.place_id, {SQL_DISPLAY_DATE} AS date
                 FROM bookings b
-                JOIN places p ON b.place_id = p.id
                 WHERE b.id = ? AND b.status = 'active'
             """, (booking_id,))
 
             row = cursor.fetchone()
-            if row:
-                return {
-                    'id': row[0],
-                    'user_id': row[1],
-                    'place_id': row[2],
-                    'date': row[3],
-                    'place_name': row[4]
-                }
-            return None
+            return _with_place_name(row) if row else None
 
     def get_all_bookings(self, future_only: bool = False) -> List[Dict]:
-        with self.get_connection() as conn:
+        generation = self._generation
+        cached = self._cache_get(("all", future_only))
+        if cached is not None:
+            return [dict(b) for b in cached]
+
+        with self.reader() as conn:
             cursor = conn.cursor()
 
             if future_only:
                 # Получаем только будущие брони
-                today = datetime.now().strftime("%d.%m.%Y")
-                cursor.execute("""
-                    SELECT b.id, b.user_id, u.username, u.first_name, b.place_id, p.name, b.booking_date, b.booking_type
+                today = date.today().isoformat()
+                cursor.execute(f"""
+                    SELECT b.id, b.user_id, u.username, u.first_name, b.place_id,
+                           {SQL_DISPLAY_DATE} AS date, COALESCE(b.booking_type, 'regular') AS booking_type
                     FROM bookings b
-                    JOIN places p ON b.place_id = p.id
                     JOIN users u ON b.user_id = u.telegram_id
                     WHERE b.status = 'active' AND b.booking_date >= ?
                     ORDER BY b.booking_date, b.place_id
                 """, (today,))
             else:
-                cursor.execute("""
-                    SELECT b.id, b.user_id, u.username, u.first_name, b.place_id, p.name, b.booking_date, b.booking_type
+                cursor.execute(f"""
+                    SELECT b.id, b.user_id, u.username, u.first_name, b.place_id,
+                           {SQL_DISPLAY_DATE} AS date, COALESCE(b.booking_type, 'regular') AS booking_type
                     FROM bookings b
-                    JOIN places p ON b.place_id = p.id
                     JOIN users u ON b.user_id = u.telegram_id
                     WHERE b.status = 'active'
                     ORDER BY b.booking_date, b.place_id
                 """)
 
-            bookings = []
-            for row in cursor.fetchall():
-                bookings.append({
-                    'id': row[0],
-                    'user_id': row[1],
-                    'username': row[2],
-                    'first_name': row[3],
-                    'place_id': row[4],
-                    'place_name': row[5],
-                    'date': row[6],
-                    'booking_type': row[7] if len(row) > 7 else 'regular'
-                })
-            return bookings
+            bookings = tuple(_with_place_name(row) for row in cursor.fetchall())
+
+        self._cache_put(("all", future_only), generation, bookings)
+        return [dict(b) for b in bookings]
 
     def cancel_all_bookings(self) -> int:
         """Отменить все обычные брони и постоянные брони"""
-        with self.get_connection() as conn:
+        with self.writer() as conn:
             cursor = conn.cursor()
 
             # Отменяем все обычные брони
@@ -404,72 +677,125 @@ class Database:
             permanent_count = cursor.rowcount
 
             conn.commit()
-            logger.info(f"Cancelled {bookings_count} bookings and {permanent_count} permanent bookings")
+            self._reload_permanent_weekdays(cursor)
+            logger.info("Cancelled %s bookings and %s permanent bookings", bookings_count, permanent_count)
             return bookings_count + permanent_count
 
     def find_user_by_username(self, username: str) -> Optional[int]:
         username = username.lstrip('@').lower()
-        with self.get_connection() as conn:
+        generation = self._generation
+        cached = self._cache_get(("username", username))
+        if cached is not None:
+            return cached
+
+        with self.reader() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT telegram_id FROM users
                 WHERE LOWER(username) = ?
             """, (username,))
             row = cursor.fetchone()
-            return row[0] if row else None
 
-    def cancel_booking_admin(self, booking_id: int) -> bool:
-        with self.get_connection() as conn:
+        if row is None:
+            return None
+        self._cache_put(("username", username), generation, row[0])
+        return row[0]
+
+    def create_booking_for_user(self, admin_user_id: int, target_user_id: int, place_id: int, date: str) -> bool:
+        with self.writer() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute("""
+                INSERT OR IGNORE INTO bookings (user_id, place_id, booking_date, status)
+                SELECT ?, ?, ?, 'active'
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM bookings
+                    WHERE place_id = ? AND booking_date = ? AND status = 'active'
+                )
+            """, (target_user_id, place_id, to_db_date(date), place_id, to_db_date(date)))
+            conn.commit()
+            return cursor.rowcount == 1
+
+    def change_booking(self, old_booking_id: int, user_id: int, new_place_id: int, new_date: str) -> bool:
+        """Перенести бронь пользователя: отмена старой и создание новой в одной транзакции"""
+        with self.writer() as conn:
             cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+
             cursor.execute("""
                 UPDATE bookings
                 SET status = 'cancelled'
-                WHERE id = ? AND status = 'active'
-            """, (booking_id,))
+                WHERE id = ? AND user_id = ? AND status = 'active'
+            """, (old_booking_id, user_id))
+
+            # Старой брони уже нет (отменена или чужая) - ничего не меняем
+            if cursor.rowcount != 1:
+                conn.rollback()
+                return False
+
+            db_date = to_db_date(new_date)
+            cursor.execute(SQL_CREATE_BOOKING, (user_id, new_place_id, db_date, user_id, db_date, new_place_id, db_date))
+
+            # Новое место занято - старая бронь остаётся
+            if cursor.rowcount != 1:
+                conn.rollback()
+                return False
+
             conn.commit()
-            return cursor.rowcount > 0
+            return True
 
-    def create_booking_for_user(self, admin_user_id: int, target_user_id: int, place_id: int, date: str) -> bool:
-        with self.get_connection() as conn:
+    def change_booking_for_user(self, old_booking_id: int, target_user_id: int,
+                                new_place_id: int, new_date: str) -> bool:
+        """Перенести бронь пользователя от имени админа в одной транзакции"""
+        with self.writer() as conn:
             cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
 
             cursor.execute("""
-                SELECT COUNT(*) FROM bookings
-                WHERE place_id = ? AND booking_date = ? AND status = 'active'
-            """, (place_id, date))
+                UPDATE bookings
+                SET status = 'cancelled'
+                WHERE id = ? AND status = 'active'
+            """, (old_booking_id,))
 
-            if cursor.fetchone()[0] > 0:
+            # Старой брони уже нет (отменена) - ничего не меняем
+            if cursor.rowcount != 1:
+                conn.rollback()
                 return False
 
-            try:
-                cursor.execute("""
-                    INSERT INTO bookings (user_id, place_id, booking_date, status)
-                    VALUES (?, ?, ?, 'active')
-                """, (target_user_id, place_id, date))
-                conn.commit()
-                return True
-            except:
+            cursor.execute("""
+                INSERT OR IGNORE INTO bookings (user_id, place_id, booking_date, status)
+                SELECT ?, ?, ?, 'active'
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM bookings
+                    WHERE place_id = ? AND booking_date = ? AND status = 'active'
+                )
+            """, (target_user_id, new_place_id, to_db_date(new_date), new_place_id, to_db_date(new_date)))
+
+            if cursor.rowcount != 1:
+                conn.rollback()
                 return False
 
+            conn.commit()
+            return True
+
     def create_permanent_booking(self, admin_id: int, user_id: int, place_id: int, weekdays: List[int]) -> bool:
         """Создать постоянную бронь"""
-        with self.get_connection() as conn:
+        with self.writer() as conn:
             cursor = conn.cursor()
             try:
                 # Проверяем, нет ли уже постоянной брони на это место + эти дни у ЛЮБОГО пользователя
+                # Пересечение дней - общий бит в масках
                 cursor.execute("""
-                    SELECT id, user_id, weekdays FROM permanent_bookings
-                    WHERE place_id = ? AND status = 'active'
-                """, (place_id,))
-
-                existing = cursor.fetchall()
-                for existing_id, existing_user_id, existing_weekdays_str in existing:
-                    existing_weekdays = [int(d) for d in existing_weekdays_str.split(',')]
-                    # Проверяем пересечение дней
-                    if any(day in existing_weekdays for day in weekdays):
-                        logger.error(
-                            f"Permanent booking conflict: place {place_id} already booked by user {existing_user_id} on overlapping days")
-                        return False
+                    SELECT user_id FROM permanent_bookings
+                    WHERE place_id = ? AND status = 'active' AND (weekdays_mask & ?) != 0
+                    LIMIT 1
+                """, (place_id, weekdays_to_mask(weekdays)))
+
+                existing = cursor.fetchone()
+                if existing:
+                    logger.error(
+                        "Permanent booking conflict: place %s already booked by user %s on overlapping days", place_id, existing[0])
+                    return False
 
                 # Проверяем, нет ли уже такой постоянной брони у этого пользователя
                 cursor.execute("""
@@ -478,105 +804,102 @@ class Database:
                 """, (user_id, place_id))
 
                 if cursor.fetchone():
-                    logger.error(f"Permanent booking already exists for user {user_id} place {place_id}")
+                    logger.error("Permanent booking already exists for user %s place %s", user_id, place_id)
                     return False
 
                 # Сохраняем постоянную бронь
                 cursor.execute("""
-                    INSERT INTO permanent_bookings (user_id, place_id, weekdays, created_by, status)
-                    VALUES (?, ?, ?, ?, 'active')
-                """, (user_id, place_id, ','.join(map(str, weekdays)), admin_id))
+                    INSERT INTO permanent_bookings (user_id, place_id, weekdays, weekdays_mask, created_by, status)
+                    VALUES (?, ?, ?, ?, ?, 'active')
+                """, (user_id, place_id, ','.join(map(str, weekdays)), weekdays_to_mask(weekdays), admin_id))
 
                 permanent_id = cursor.lastrowid
 
                 # Создаём брони на ближайшие 90 дней
-                today = datetime.now().date()
-                created_count = 0
-                for i in range(90):
-                    check_date = today + timedelta(days=i)
-                    if check_date.weekday() in weekdays:
-                        date_str = check_date.strftime("%d.%m.%Y")
-
-                        # Проверяем, нет ли уже брони
-                        cursor.execute("""
-                            SELECT COUNT(*) FROM bookings
-                            WHERE place_id = ? AND booking_date = ? AND status = 'active'
-                        """, (place_id, date_str))
-
-                        if cursor.fetchone()[0] == 0:
-                            cursor.execute("""
-                                INSERT INTO bookings (user_id, place_id, booking_date, status, booking_type, permanent_booking_id)
-                                VALUES (?, ?, ?, 'active', 'permanent', ?)
-                            """, (user_id, place_id, date_str, permanent_id))
-                            created_count += 1
+                created_count = self._insert_permanent_dates(cursor, user_id, place_id, permanent_id, weekdays)
 
                 conn.commit()
-                logger.info(f"Created permanent booking {permanent_id} with {created_count} dates")
+                self._reload_permanent_weekdays(cursor)
+                logger.info("Created permanent booking %s with %s dates", permanent_id, created_count)
                 return True
-            except Exception as e:
-                logger.error(f"Error creating permanent booking: {e}")
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error("Error creating permanent booking: %s", e)
                 return False
 
+    @staticmethod
+    def _insert_permanent_dates(cursor: sqlite3.Cursor, user_id: int, place_id: int,
+                                permanent_id: int, weekdays: List[int]) -> int:
+        """Создать даты постоянной брони на 90 дней одним executemany, вернуть число созданных"""
+        today = date.today()
+        # День недели i-го дня считаем от сегодняшнего, дату строим только для нужных дней
+        start_weekday = today.weekday()
+        weekdays = set(weekdays)
+        rows = []
+        for i in range(90):
+            if (start_weekday + i) % 7 in weekdays:
+                date_str = (today + timedelta(days=i)).isoformat()
+                rows.append((user_id, place_id, date_str, permanent_id, place_id, date_str))
+        cursor.executemany(SQL_INSERT_PERMANENT_DATE, rows)
+        return cursor.rowcount
+
     def get_permanent_bookings(self, user_id: int = None) -> List[Dict]:
         """Получить постоянные брони"""
-        with self.get_connection() as conn:
+        with self.reader() as conn:
             cursor = conn.cursor()
             if user_id:
                 cursor.execute("""
-                    SELECT pb.id, pb.user_id, u.username, u.first_name, pb.place_id, p.name, pb.weekdays, pb.created_at
+                    SELECT pb.id, pb.user_id, u.username, u.first_name, pb.place_id, pb.weekdays_mask, pb.created_at
                     FROM permanent_bookings pb
                     JOIN users u ON pb.user_id = u.telegram_id
-                    JOIN places p ON pb.place_id = p.id
                     WHERE pb.status = 'active' AND pb.user_id = ?
                     ORDER BY pb.place_id
                 """, (user_id,))
             else:
                 cursor.execute("""
-                    SELECT pb.id, pb.user_id, u.username, u.first_name, pb.place_id, p.name, pb.weekdays, pb.created_at
+                    SELECT pb.id, pb.user_id, u.username, u.first_name, pb.place_id, pb.weekdays_mask, pb.created_at
                     FROM permanent_bookings pb
                     JOIN users u ON pb.user_id = u.telegram_id
-                    JOIN places p ON pb.place_id = p.id
                     WHERE pb.status = 'active'
                     ORDER BY pb.user_id, pb.place_id
                 """)
 
             bookings = []
             for row in cursor.fetchall():
-                weekdays = [int(d) for d in row[6].split(',')]
+                weekdays = mask_to_weekdays(row[5])
                 bookings.append({
                     'id': row[0],
                     'user_id': row[1],
                     'username': row[2],
                     'first_name': row[3],
                     'place_id': row[4],
-                    'place_name': row[5],
+                    'place_name': PLACE_NAMES[row[4]],
                     'weekdays': weekdays,
-                    'created_at': row[7]
+                    'created_at': row[6]
                 })
             return bookings
 
     def get_permanent_booking_by_id(self, permanent_id: int) -> Optional[Dict]:
         """Получить постоянную бронь по ID"""
-        with self.get_connection() as conn:
+        with self.reader() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT pb.id, pb.user_id, u.username, u.first_name, pb.place_id, p.name, pb.weekdays
+                SELECT pb.id, pb.user_id, u.username, u.first_name, pb.place_id, pb.weekdays_mask
                 FROM permanent_bookings pb
                 JOIN users u ON pb.user_id = u.telegram_id
-                JOIN places p ON pb.place_id = p.id
                 WHERE pb.id = ? AND pb.status = 'active'
             """, (permanent_id,))
 
             row = cursor.fetchone()
             if row:
-                weekdays = [int(d) for d in row[6].split(',')]
+                weekdays = mask_to_weekdays(row[5])
                 return {
                     'id': row[0],
                     'user_id': row[1],
                     'username': row[2],
                     'first_name': row[3],
                     'place_id': row[4],
-                    'place_name': row[5],
+                    'place_name': PLACE_NAMES[row[4]],
                     'weekdays': weekdays
                 }
             return None
@@ -584,22 +907,22 @@ class Database:
     def extend_permanent_booking(self, permanent_id: int, new_place_id: int = None,
                                  new_weekdays: List[int] = None) -> bool:
         """Продлить постоянную бронь на 90 дней с возможностью изменения места и дней"""
-        with self.get_connection() as conn:
+        with self.writer() as conn:
             cursor = conn.cursor()
             try:
                 # Получаем текущую постоянную бронь
                 cursor.execute("""
-                    SELECT user_id, place_id, weekdays FROM permanent_bookings
+                    SELECT user_id, place_id, weekdays_mask FROM permanent_bookings
                     WHERE id = ? AND status = 'active'
                 """, (permanent_id,))
 
                 result = cursor.fetchone()
                 if not result:
-                    logger.error(f"Permanent booking {permanent_id} not found")
+                    logger.error("Permanent booking %s not found", permanent_id)
                     return False
 
-                user_id, old_place_id, old_weekdays_str = result
-                old_weekdays = [int(d) for d in old_weekdays_str.split(',')]
+                user_id, old_place_id, old_mask = result
+                old_weekdays = mask_to_weekdays(old_mask)
 
                 # Определяем новые параметры (если не переданы, используем старые)
                 final_place_id = new_place_id if new_place_id else old_place_id
@@ -609,16 +932,16 @@ class Database:
                 if new_place_id or new_weekdays:
                     # Проверяем конфликты с другими постоянными бронями
                     cursor.execute("""
-                        SELECT id, user_id, weekdays FROM permanent_bookings
+                        SELECT id FROM permanent_bookings
                         WHERE place_id = ? AND status = 'active' AND id != ?
-                    """, (final_place_id, permanent_id))
+                          AND (weekdays_mask & ?) != 0
+                        LIMIT 1
+                    """, (final_place_id, permanent_id, weekdays_to_mask(final_weekdays)))
 
-                    existing = cursor.fetchall()
-                    for existing_id, existing_user_id, existing_weekdays_str in existing:
-                        existing_weekdays = [int(d) for d in existing_weekdays_str.split(',')]
-                        if any(day in existing_weekdays for day in final_weekdays):
-                            logger.error(f"Conflict with permanent booking {existing_id}")
-                            return False
+                    existing = cursor.fetchone()
+                    if existing:
+                        logger.error("Conflict with permanent booking %s", existing[0])
+                        return False
 
                 # Удаляем старую постоянную бронь и все её будущие даты
                 cursor.execute("""
@@ -628,63 +951,40 @@ class Database:
                 """, (permanent_id,))
 
                 # Отменяем все будущие брони старой постоянной брони
+                today = date.today()
                 cursor.execute("""
-                    SELECT id, booking_date FROM bookings
-                    WHERE permanent_booking_id = ? AND status = 'active'
-                """, (permanent_id,))
-
-                bookings_to_cancel = cursor.fetchall()
-                today = datetime.now().date()
-
-                for booking_id, booking_date_str in bookings_to_cancel:
-                    booking_date = datetime.strptime(booking_date_str, "%d.%m.%Y").date()
-                    if booking_date >= today:
-                        cursor.execute("""
-                            UPDATE bookings
-                            SET status = 'cancelled'
-                            WHERE id = ?
-                        """, (booking_id,))
+                    UPDATE bookings
+                    SET status = 'cancelled'
+                    WHERE permanent_booking_id = ? AND status = 'active' AND booking_date >= ?
+                """, (permanent_id, today.isoformat()))
 
                 # Создаём новую постоянную бронь
                 cursor.execute("""
-                    INSERT INTO permanent_bookings (user_id, place_id, weekdays, created_by, status)
-                    VALUES (?, ?, ?, ?, 'active')
-                """, (user_id, final_place_id, ','.join(map(str, final_weekdays)), user_id))
+                    INSERT INTO permanent_bookings (user_id, place_id, weekdays, weekdays_mask, created_by, status)
+                    VALUES (?, ?, ?, ?, ?, 'active')
+                """, (user_id, final_place_id, ','.join(map(str, final_weekdays)),
+                      weekdays_to_mask(final_weekdays), user_id))
 
                 new_permanent_id = cursor.lastrowid
 
                 # Создаём брони на 90 дней
-                created_count = 0
-                for i in range(90):
-                    check_date = today + timedelta(days=i)
-                    if check_date.weekday() in final_weekdays:
-                        date_str = check_date.strftime("%d.%m.%Y")
-
-                        # Проверяем, нет ли уже брони
-                        cursor.execute("""
-                            SELECT COUNT(*) FROM bookings
-                            WHERE place_id = ? AND booking_date = ? AND status = 'active'
-                        """, (final_place_id, date_str))
-
-                        if cursor.fetchone()[0] == 0:
-                            cursor.execute("""
-                                INSERT INTO bookings (user_id, place_id, booking_date, status, booking_type, permanent_booking_id)
-                                VALUES (?, ?, ?, 'active', 'permanent', ?)
-                            """, (user_id, final_place_id, date_str, new_permanent_id))
-                            created_count += 1
+                created_count = self._insert_permanent_dates(
+                    cursor, user_id, final_place_id, new_permanent_id, final_weekdays)
 
                 conn.commit()
+                self._reload_permanent_weekdays(cursor)
                 logger.info(
-                    f"Extended permanent booking {permanent_id} -> new {new_permanent_id} with {created_count} dates")
+                    "Extended permanent booking %s -> new %s with %s dates", permanent_id, new_permanent_id, created_count)
                 return True
 
-            except Exception as e:
-                logger.error(f"Error extending permanent booking: {e}")
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error("Error extending permanent booking: %s", e)
                 return False
 
     def delete_permanent_booking(self, permanent_id: int) -> bool:
         """Удалить постоянную бронь и все связанные будущие брони"""
-        with self.get_connection() as conn:
+        with self.writer() as conn:
             cursor = conn.cursor()
             try:
                 # Помечаем постоянную бронь как удалённую
@@ -694,39 +994,26 @@ class Database:
                     WHERE id = ?
                 """, (permanent_id,))
 
-                # Удаляем все будущие брони этой постоянной брони
-                # Получаем все брони с этим permanent_booking_id
+                # Отменяем все будущие брони этой постоянной брони
+                # (даты в ISO - сравнение строк совпадает со сравнением дат)
                 cursor.execute("""
-                    SELECT id, booking_date FROM bookings
-                    WHERE permanent_booking_id = ? AND status = 'active'
-                """, (permanent_id,))
-
-                bookings_to_check = cursor.fetchall()
-                today = datetime.now().date()
-
-                # Проверяем каждую бронь и удаляем только будущие
-                for booking_id, booking_date_str in bookings_to_check:
-                    # Конвертируем строку DD.MM.YYYY в объект date
-                    booking_date = datetime.strptime(booking_date_str, "%d.%m.%Y").date()
-
-                    # Если дата в будущем - отменяем
-                    if booking_date >= today:
-                        cursor.execute("""
-                            UPDATE bookings
-                            SET status = 'cancelled'
-                            WHERE id = ?
-                        """, (booking_id,))
+                    UPDATE bookings
+                    SET status = 'cancelled'
+                    WHERE permanent_booking_id = ? AND status = 'active' AND booking_date >= ?
+                """, (permanent_id, date.today().isoformat()))
 
                 conn.commit()
-                logger.info(f"Deleted permanent booking {permanent_id} and future bookings")
+                self._reload_permanent_weekdays(cursor)
+                logger.info("Deleted permanent booking %s and future bookings", permanent_id)
                 return True
-            except Exception as e:
-                logger.error(f"Error deleting permanent booking: {e}")
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error("Error deleting permanent booking: %s", e)
                 return False
 
     def add_admin(self, admin_id: int, added_by: int) -> bool:
         """Добавить администратора в БД"""
-        with self.get_connection() as conn:
+        with self.writer() as conn:
             cursor = conn.cursor()
             try:
                 cursor.execute("""
@@ -735,8 +1022,9 @@ class Database:
                 """, (admin_id, added_by))
                 conn.commit()
                 return cursor.rowcount > 0
-            except Exception as e:
-                logger.error(f"Error adding admin: {e}")
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error("Error adding admin: %s", e)
                 return False
 
     def remove_admin(self, admin_id: int) -> bool:
@@ -744,7 +1032,7 @@ class Database:
         if admin_id == SUPER_ADMIN_ID:
             return False
 
-        with self.get_connection() as conn:
+        with self.writer() as conn:
             cursor = conn.cursor()
             try:
                 cursor.execute("""
@@ -752,20 +1040,21 @@ class Database:
                 """, (admin_id,))
                 conn.commit()
                 return cursor.rowcount > 0
-            except Exception as e:
-                logger.error(f"Error removing admin: {e}")
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error("Error removing admin: %s", e)
                 return False
 
     def get_all_admins(self) -> List[int]:
         """Получить список всех администраторов из БД"""
-        with self.get_connection() as conn:
+        with self.reader() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT telegram_id FROM admins")
             return [row[0] for row in cursor.fetchall()]
 
     def get_all_admins_with_info(self) -> List[Dict]:
         """Получить список администраторов с информацией о них"""
-        with self.get_connection() as conn:
+        with self.reader() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT a.telegram_id, u.username, u.first_name
@@ -773,102 +1062,263 @@ class Database:
                 LEFT JOIN users u ON a.telegram_id = u.telegram_id
                 ORDER BY a.telegram_id
             """)
-
-            admins = []
-            for row in cursor.fetchall():
-                admins.append({
-                    'telegram_id': row[0],
-                    'username': row[1],
-                    'first_name': row[2]
-                })
-            return admins
+            return [dict(row) for row in cursor.fetchall()]
 
 
 # Инициализация
 db = Database()
 
 # Загружаем список администраторов из БД
-ADMIN_IDS = db.get_all_admins()
-logger.info(f"Loaded {len(ADMIN_IDS)} admins from database: {ADMIN_IDS}")
-
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+ADMIN_IDS = frozenset(db.get_all_admins())
+logger.info("Loaded %s admins from database: %s", len(ADMIN_IDS), ADMIN_IDS)
+
+
+class ChatLockMiddleware(BaseMiddleware):
+    """Апдейты одного чата обрабатываются по очереди, разных чатов - параллельно"""
+
+    def __init__(self):
+        # Чатов у офисного бота немного, поэтому блокировки не удаляем
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    async def __call__(self, handler, event, data):
+        chat = data.get("event_chat")
+        if chat is None:
+            return await handler(event, data)
+
+        lock = self._locks.setdefault(chat.id, asyncio.Lock())
+        async with lock:
+            return await handler(event, data)
+
+
+# Все сообщения бота размечены HTML - задаём режим один раз, а не в каждом вызове
+# Одна HTTP-сессия с keep-alive соединениями к api.telegram.org (пул aiogram по умолчанию - 100)
+# С orjson (если установлен) быстрее разбираются ответы API и апдейты вебхука
+json_options = {} if orjson is None else {
+    "json_loads": orjson.loads,
+    "json_dumps": lambda value: orjson.dumps(value).decode(),
+}
+bot = Bot(
+    token=BOT_TOKEN,
+    session=AiohttpSession(timeout=TELEGRAM_REQUEST_TIMEOUT, **json_options),
+    default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+)
+if REDIS_URL:
+    # Импортируем только при необходимости: пакет redis ставится отдельно (aiogram[redis])
+    from aiogram.fsm.storage.redis import RedisStorage
+    storage = RedisStorage.from_url(REDIS_URL)
+else:
+    storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 router = Router()
+# Подключаем при импорте: обработчики регистрируются декораторами ниже в этот же роутер
+dp.include_router(router)
+# Апдейты уже обрабатываются задачами (handle_as_tasks), но двойной клик
+# в одном чате не должен гоняться за одно и то же состояние FSM
+dp.update.outer_middleware(ChatLockMiddleware())
+
+# Карта офиса: файл оборачиваем один раз, после первой отправки используем file_id Telegram
+OFFICE_MAP = FSInputFile(OFFICE_MAP_PATH) if os.path.exists(OFFICE_MAP_PATH) else None
+OFFICE_MAP_FILE_ID: Optional[str] = None
+
+# Ожидаемые ошибки обработчиков: неверные данные кнопки, сбой БД, ответ Telegram.
+# Всё остальное не глушим - такие исключения логирует диспетчер aiogram
+HANDLER_ERRORS = (ValueError, sqlite3.Error, TelegramAPIError)
 
 
 def is_admin(user_id: int) -> bool:
     return user_id in ADMIN_IDS
 
 
+# Ограничение одновременных вызовов БД: лишние ждут в цикле событий, а не занимают
+# потоки пула в ожидании соединения. Создаётся при первом вызове, уже внутри цикла
+_db_slots: Optional[asyncio.Semaphore] = None
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполнить блокирующий вызов БД в пуле потоков, не останавливая цикл событий"""
+    global _db_slots
+    if _db_slots is None:
+        _db_slots = asyncio.Semaphore(DB_MAX_CONCURRENCY)
+    async with _db_slots:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
+# Запросы к БД, которые выполняются прямо сейчас: ключ -> задача
+_inflight_db: Dict[tuple, asyncio.Task] = {}
+
+
+async def run_db_shared(key: tuple, func, *args, **kwargs):
+    """Как run_db, но одинаковые одновременные запросы выполняются один раз"""
+    # Все ожидающие получают один и тот же объект результата - его нельзя изменять
+    task = _inflight_db.get(key)
+    if task is None:
+        task = asyncio.create_task(run_db(func, *args, **kwargs))
+        _inflight_db[key] = task
+        task.add_done_callback(lambda _: _inflight_db.pop(key, None))
+    # shield: отмена одного ожидающего не отменяет запрос для остальных
+    return await asyncio.shield(task)
+
+
+# Когда пользователь последний раз нажимал кнопку меню: (user_id, текст кнопки) -> time.monotonic().
+# Хранятся только нажатия за последние CALENDAR_DEBOUNCE секунд
+_last_menu_press: Dict[tuple, float] = {}
+
+
+def is_repeated_press(message: Message) -> bool:
+    """Повторное нажатие той же кнопки меню в течение CALENDAR_DEBOUNCE секунд - игнорируем"""
+    key = (message.from_user.id, message.text)
+    now = time.monotonic()
+    # Записи добавляются по времени нажатия - устаревшие всегда в начале словаря
+    while _last_menu_press:
+        oldest = next(iter(_last_menu_press))
+        if now - _last_menu_press[oldest] < CALENDAR_DEBOUNCE:
+            break
+        del _last_menu_press[oldest]
+    if key in _last_menu_press:
+        return True
+    _last_menu_press[key] = now
+    return False
+
+
 # Клавиатуры
+# Статичные клавиатуры собираются один раз при импорте (модели aiogram неизменяемы)
+MAIN_MENU = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="🪑 Забронировать место")],
+        [KeyboardButton(text="📅 Мои брони")],
+        [KeyboardButton(text="❌ Отменить бронь")],
+        [KeyboardButton(text="🔁 Поменять бронь")]
+    ],
+    resize_keyboard=True
+)
+
+ADMIN_MENU = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="🪑 Забронировать место")],
+        [KeyboardButton(text="📅 Мои брони")],
+        [KeyboardButton(text="❌ Отменить бронь")],
+        [KeyboardButton(text="🔁 Поменять бронь")],
+        [KeyboardButton(text="⚙️ АДМИН-ПАНЕЛЬ")]
+    ],
+    resize_keyboard=True
+)
+
+ADMIN_PANEL_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📋 Все брони", callback_data="admin_all_bookings")],
+    [InlineKeyboardButton(text="❌ Отменить все брони", callback_data="admin_cancel_all")],
+    [InlineKeyboardButton(text="🗑️ Отменить бронь пользователя", callback_data="admin_cancel_user")],
+    [InlineKeyboardButton(text="➕ Забронировать за пользователя", callback_data="admin_book_for_user")],
+    [InlineKeyboardButton(text="🔄 Изменить бронь пользователя", callback_data="admin_change_for_user")],
+    [InlineKeyboardButton(text="📌 Постоянные брони", callback_data="admin_permanent_menu")],
+    [InlineKeyboardButton(text="🗺️ Заменить карту офиса", callback_data="admin_change_map")],
+    [InlineKeyboardButton(text="👤 Добавить администратора", callback_data="admin_add_admin")],
+    [InlineKeyboardButton(text="🗑 Удалить администратора", callback_data="admin_remove_admin")]
+])
+
+PERMANENT_BOOKINGS_MENU = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="➕ Создать постоянную бронь", callback_data="admin_create_permanent")],
+    [InlineKeyboardButton(text="🔄 Продлить постоянную бронь", callback_data="admin_extend_permanent")],
+    [InlineKeyboardButton(text="📋 Все постоянные брони", callback_data="admin_view_all_permanent")],
+    [InlineKeyboardButton(text="👤 Постоянные брони пользователя", callback_data="admin_view_user_permanent")],
+    [InlineKeyboardButton(text="🗑️ Удалить постоянную бронь", callback_data="admin_delete_permanent")],
+    [InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back_to_main")]
+])
+
+CONFIRMATION_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ ОК", callback_data="confirm_yes"),
+        InlineKeyboardButton(text="🔁 Поменять", callback_data="confirm_change"),
+        InlineKeyboardButton(text="❌ Отмена", callback_data="confirm_cancel")
+    ]
+])
+
+BOOKINGS_VIEW_MENU = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📅 Посмотреть по дате", callback_data="bookings_by_date")],
+    [InlineKeyboardButton(text="🪑 Посмотреть по столу", callback_data="bookings_by_place")],
+    [InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back_to_main")]
+])
+
+BACK_TO_DATES_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="◀️ Назад", callback_data="bookings_by_date")]
+])
+
+BACK_TO_PLACES_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="◀️ Назад", callback_data="bookings_by_place")]
+])
+
+CANCEL_ALL_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ Да, отменить все", callback_data="admin_cancel_all_confirm"),
+        InlineKeyboardButton(text="❌ Отмена", callback_data="admin_cancel_action")
+    ]
+])
+
+PERMANENT_CREATE_CONFIRM_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ Создать", callback_data="permanent_create_confirm"),
+        InlineKeyboardButton(text="❌ Отмена", callback_data="permanent_create_cancel")
+    ]
+])
+
+EXTEND_PERMANENT_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="✅ Продлить без изменений", callback_data="extend_confirm_same")],
+    [InlineKeyboardButton(text="🔧 Изменить место или дни", callback_data="extend_edit")],
+    [InlineKeyboardButton(text="❌ Отмена", callback_data="extend_cancel")]
+])
+
+EXTEND_CONFIRM_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ Продлить", callback_data="extend_confirm_edited"),
+        InlineKeyboardButton(text="❌ Отмена", callback_data="extend_cancel")
+    ]
+])
+
+WEEKDAY_NAMES = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+WEEK_DAYS_ROW = [InlineKeyboardButton(text=day, callback_data="ignore") for day in WEEKDAY_NAMES]
+
+# Некликабельные кнопки календарей одинаковы во всех месяцах - создаём один раз
+EMPTY_DAY_BUTTON = InlineKeyboardButton(text=" ", callback_data="ignore")
+PAST_DAY_BUTTON = InlineKeyboardButton(text="·", callback_data="ignore")
+PLAIN_DAY_BUTTONS = [InlineKeyboardButton(text=str(day), callback_data="ignore") for day in range(32)]
+CALENDAR_CANCEL_BUTTON = InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_calendar")
+CALENDAR_CLOSE_BUTTON = InlineKeyboardButton(text="❌ Закрыть", callback_data="close_calendar")
+
+# Тексты, которые отправляются из нескольких обработчиков
+ADMIN_PANEL_TEXT = "🔒 <b>Админ-панель</b>\n\nВыберите действие:"
+PICK_PLACE_TEXT = "👇 Выберите место:"
+PICK_BOOKING_TO_CANCEL_TEXT = "Выберите бронь для отмены:"
+PICK_BOOKING_TO_CHANGE_TEXT = "Выберите бронь, которую хотите изменить:"
+PICK_BOOKED_DATE_TEXT = "Выберите дату для просмотра деталей:\n[15] — забронированный день"
+NO_WEEKDAYS_TEXT = "⚠️ Выберите хотя бы один день!"
+
+
 def get_main_menu():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🪑 Забронировать место")],
-            [KeyboardButton(text="📅 Мои брони")],
-            [KeyboardButton(text="❌ Отменить бронь")],
-            [KeyboardButton(text="🔁 Поменять бронь")]
-        ],
-        resize_keyboard=True
-    )
-    return keyboard
+    return MAIN_MENU
 
 
 def get_admin_menu():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🪑 Забронировать место")],
-            [KeyboardButton(text="📅 Мои брони")],
-            [KeyboardButton(text="❌ Отменить бронь")],
-            [KeyboardButton(text="🔁 Поменять бронь")],
-            [KeyboardButton(text="⚙️ АДМИН-ПАНЕЛЬ")]
-        ],
-        resize_keyboard=True
-    )
-    return keyboard
+    return ADMIN_MENU
 
 
 def get_admin_panel_keyboard():
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📋 Все брони", callback_data="admin_all_bookings")],
-        [InlineKeyboardButton(text="❌ Отменить все брони", callback_data="admin_cancel_all")],
-        [InlineKeyboardButton(text="🗑️ Отменить бронь пользователя", callback_data="admin_cancel_user")],
-        [InlineKeyboardButton(text="➕ Забронировать за пользователя", callback_data="admin_book_for_user")],
-        [InlineKeyboardButton(text="🔄 Изменить бронь пользователя", callback_data="admin_change_for_user")],
-        [InlineKeyboardButton(text="📌 Постоянные брони", callback_data="admin_permanent_menu")],
-        [InlineKeyboardButton(text="🗺️ Заменить карту офиса", callback_data="admin_change_map")],
-        [InlineKeyboardButton(text="👤 Добавить администратора", callback_data="admin_add_admin")],
-        [InlineKeyboardButton(text="🗑 Удалить администратора", callback_data="admin_remove_admin")]
-    ])
-    return keyboard
+    return ADMIN_PANEL_KEYBOARD
 
 
 def get_permanent_bookings_menu():
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="➕ Создать постоянную бронь", callback_data="admin_create_permanent")],
-        [InlineKeyboardButton(text="🔄 Продлить постоянную бронь", callback_data="admin_extend_permanent")],
-        [InlineKeyboardButton(text="📋 Все постоянные брони", callback_data="admin_view_all_permanent")],
-        [InlineKeyboardButton(text="👤 Постоянные брони пользователя", callback_data="admin_view_user_permanent")],
-        [InlineKeyboardButton(text="🗑️ Удалить постоянную бронь", callback_data="admin_delete_permanent")],
-        [InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back_to_main")]
-    ])
-    return keyboard
+    return PERMANENT_BOOKINGS_MENU
 
 
 def get_weekday_keyboard(selected: List[int] = None) -> InlineKeyboardMarkup:
     """Клавиатура выбора дней недели"""
-    if selected is None:
-        selected = []
+    # Вариантов выбора всего 2^7 - каждая клавиатура строится один раз
+    return _build_weekday_keyboard(frozenset(selected or ()))
 
-    weekdays = [
-        ("Пн", 0), ("Вт", 1), ("Ср", 2), ("Чт", 3),
-        ("Пт", 4), ("Сб", 5), ("Вс", 6)
-    ]
 
+@lru_cache(maxsize=128)
+def _build_weekday_keyboard(selected: frozenset) -> InlineKeyboardMarkup:
     buttons = []
     row = []
-    for name, num in weekdays:
+    for num, name in enumerate(WEEKDAY_NAMES):
         check = "✅" if num in selected else "⬜️"
         row.append(InlineKeyboardButton(
             text=f"{check} {name}",
@@ -890,6 +1340,11 @@ def get_weekday_keyboard(selected: List[int] = None) -> InlineKeyboardMarkup:
 
 
 def get_places_keyboard(available_places: List[int]) -> InlineKeyboardMarkup:
+    return _build_places_keyboard(tuple(available_places))
+
+
+@lru_cache(maxsize=64)
+def _build_places_keyboard(available_places: tuple) -> InlineKeyboardMarkup:
     buttons = []
     row = []
 
@@ -907,55 +1362,67 @@ def get_places_keyboard(available_places: List[int]) -> InlineKeyboardMarkup:
 
 
 def get_confirmation_keyboard() -> InlineKeyboardMarkup:
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="✅ ОК", callback_data="confirm_yes"),
-            InlineKeyboardButton(text="🔁 Поменять", callback_data="confirm_change"),
-            InlineKeyboardButton(text="❌ Отмена", callback_data="confirm_cancel")
-        ]
-    ])
-    return keyboard
+    return CONFIRMATION_KEYBOARD
 
 
 def get_bookings_keyboard(bookings: List[Dict]) -> InlineKeyboardMarkup:
+    # Ключ кэша - всё, что попадает в кнопки: тот же список броней даёт ту же клавиатуру
+    key = tuple((b['id'], b['place_name'], b['date'], b.get('booking_type')) for b in bookings)
+    return _build_bookings_keyboard(key)
+
+
+@lru_cache(maxsize=1024)
+def _build_bookings_keyboard(bookings: tuple) -> InlineKeyboardMarkup:
     buttons = []
-    for booking in bookings:
-        icon = "📌" if booking.get('booking_type') == 'permanent' else "📅"
-        button_text = f"{icon} {booking['place_name']} - {booking['date']}"
+    for booking_id, place_name, booking_date, booking_type in bookings:
+        icon = "📌" if booking_type == 'permanent' else "📅"
+        button_text = f"{icon} {place_name} - {booking_date}"
         buttons.append([InlineKeyboardButton(
             text=button_text,
-            callback_data=f"booking_{booking['id']}"
+            callback_data=f"booking_{booking_id}"
         )])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@lru_cache(maxsize=64)
+def _calendar_header_rows(year: int, month: int) -> tuple:
+    """Заголовок месяца и строка дней недели - одинаковы для всех календарей месяца"""
+    month_name = calendar.month_name[month]
+    return (
+        [InlineKeyboardButton(text=f"📅 {month_name} {year}", callback_data="ignore")],
+        WEEK_DAYS_ROW,
+    )
+
+
 def get_calendar_keyboard(year: int, month: int) -> InlineKeyboardMarkup:
-    buttons = []
+    return _build_calendar_keyboard(year, month, date.today())
 
-    month_name = calendar.month_name[month]
-    buttons.append([InlineKeyboardButton(
-        text=f"📅 {month_name} {year}",
-        callback_data="ignore"
-    )])
 
-    week_days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-    buttons.append([InlineKeyboardButton(text=day, callback_data="ignore") for day in week_days])
+def get_current_calendar_keyboard() -> InlineKeyboardMarkup:
+    """Календарь на текущий месяц (одно обращение к часам вместо двух)"""
+    today = date.today()
+    return _build_calendar_keyboard(today.year, today.month, today)
+
+
+@lru_cache(maxsize=24)
+def _build_calendar_keyboard(year: int, month: int, today: date) -> InlineKeyboardMarkup:
+    """Календарь зависит только от месяца и текущего дня - кэшируем по ним"""
+    buttons = list(_calendar_header_rows(year, month))
 
     month_calendar = calendar.monthcalendar(year, month)
-    today = datetime.now().date()
 
     for week in month_calendar:
         row = []
         for day in week:
             if day == 0:
-                row.append(InlineKeyboardButton(text=" ", callback_data="ignore"))
+                row.append(EMPTY_DAY_BUTTON)
             else:
-                date = datetime(year, month, day).date()
+                day_date = date(year, month, day)
 
-                if date < today:
-                    row.append(InlineKeyboardButton(text="·", callback_data="ignore"))
+                if day_date < today:
+                    row.append(PAST_DAY_BUTTON)
                 else:
-                    date_str = date.strftime("%d.%m.%Y")
+                    date_str = day_date.strftime("%d.%m.%Y")
                     row.append(InlineKeyboardButton(
                         text=str(day),
                         callback_data=f"date_{date_str}"
@@ -970,15 +1437,15 @@ def get_calendar_keyboard(year: int, month: int) -> InlineKeyboardMarkup:
         prev_month = 12
         prev_year -= 1
 
-    if datetime(prev_year, prev_month, 1).date() >= datetime(today.year, today.month, 1).date():
+    if date(prev_year, prev_month, 1) >= date(today.year, today.month, 1):
         nav_row.append(InlineKeyboardButton(
             text="◀️",
             callback_data=f"cal_{prev_year}_{prev_month}"
         ))
     else:
-        nav_row.append(InlineKeyboardButton(text=" ", callback_data="ignore"))
+        nav_row.append(EMPTY_DAY_BUTTON)
 
-    nav_row.append(InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_calendar"))
+    nav_row.append(CALENDAR_CANCEL_BUTTON)
 
     next_month = month + 1
     next_year = year
@@ -998,16 +1465,15 @@ def get_calendar_keyboard(year: int, month: int) -> InlineKeyboardMarkup:
 
 def get_bookings_calendar_keyboard(year: int, month: int, booked_dates: List[str]) -> InlineKeyboardMarkup:
     """Календарь с выделенными забронированными днями"""
-    buttons = []
+    # В ключ кэша идут только даты этого месяца: брони в других месяцах его не меняют
+    month_suffix = f".{month:02d}.{year}"
+    month_booked = frozenset(d for d in booked_dates if d.endswith(month_suffix))
+    return _build_bookings_calendar_keyboard(year, month, month_booked)
 
-    month_name = calendar.month_name[month]
-    buttons.append([InlineKeyboardButton(
-        text=f"📅 {month_name} {year}",
-        callback_data="ignore"
-    )])
 
-    week_days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-    buttons.append([InlineKeyboardButton(text=day, callback_data="ignore") for day in week_days])
+@lru_cache(maxsize=128)
+def _build_bookings_calendar_keyboard(year: int, month: int, booked_dates: frozenset) -> InlineKeyboardMarkup:
+    buttons = list(_calendar_header_rows(year, month))
 
     month_calendar = calendar.monthcalendar(year, month)
 
@@ -1015,10 +1481,9 @@ def get_bookings_calendar_keyboard(year: int, month: int, booked_dates: List[str
         row = []
         for day in week:
             if day == 0:
-                row.append(InlineKeyboardButton(text=" ", callback_data="ignore"))
+                row.append(EMPTY_DAY_BUTTON)
             else:
-                date = datetime(year, month, day).date()
-                date_str = date.strftime("%d.%m.%Y")
+                date_str = date(year, month, day).strftime("%d.%m.%Y")
 
                 if date_str in booked_dates:
                     # День с бронью - в квадратных скобках
@@ -1028,7 +1493,7 @@ def get_bookings_calendar_keyboard(year: int, month: int, booked_dates: List[str
                     ))
                 else:
                     # Обычный день - некликабельный
-                    row.append(InlineKeyboardButton(text=str(day), callback_data="ignore"))
+                    row.append(PLAIN_DAY_BUTTONS[day])
         buttons.append(row)
 
     # Навигация
@@ -1045,7 +1510,7 @@ def get_bookings_calendar_keyboard(year: int, month: int, booked_dates: List[str
         callback_data=f"booking_cal_{prev_year}_{prev_month}"
     ))
 
-    nav_row.append(InlineKeyboardButton(text="❌ Закрыть", callback_data="close_calendar"))
+    nav_row.append(CALENDAR_CLOSE_BUTTON)
 
     next_month = month + 1
     next_year = year
@@ -1063,13 +1528,40 @@ def get_bookings_calendar_keyboard(year: int, month: int, booked_dates: List[str
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+async def send_office_map(message: Message, caption: str):
+    """Отправить карту офиса, если она есть (повторно - по file_id, без загрузки файла)"""
+    global OFFICE_MAP_FILE_ID
+
+    if OFFICE_MAP is None:
+        return
+
+    try:
+        sent = await message.answer_photo(
+            photo=OFFICE_MAP_FILE_ID or OFFICE_MAP,
+            caption=caption
+        )
+        OFFICE_MAP_FILE_ID = sent.photo[-1].file_id
+    except (OSError, TelegramAPIError) as e:
+        logger.error("Error sending office map: %s", e)
+
+
+async def edit_or_answer(callback: CallbackQuery, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+    """Заменить сообщение с нажатой кнопкой новым текстом, а если нельзя - отправить новое"""
+    try:
+        await callback.message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e):
+            return
+        await callback.message.answer(text, reply_markup=reply_markup)
+
+
 # Обработчики команд
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     user = message.from_user
-    db.add_user(user.id, user.username, user.first_name)
+    await run_db(db.add_user, user.id, user.username, user.first_name)
 
-    logger.info(f"User started bot: ID={user.id}, username={user.username}, name={user.first_name}")
+    logger.info("User started bot: ID=%s, username=%s, name=%s", user.id, user.username, user.first_name)
 
     is_admin_user = is_admin(user.id)
     menu = get_admin_menu() if is_admin_user else get_main_menu()
@@ -1083,23 +1575,24 @@ async def cmd_start(message: Message):
 
     greeting += "\nВыбери нужное действие:"
 
-    await message.answer(greeting, reply_markup=menu, parse_mode="HTML")
+    await message.answer(greeting, reply_markup=menu)
 
 
 @router.message(F.text == "🪑 Забронировать место")
 async def start_booking(message: Message, state: FSMContext):
-    now = datetime.now()
-    await message.answer(
-        "Выберите дату бронирования:",
-        reply_markup=get_calendar_keyboard(now.year, now.month)
+    if is_repeated_press(message):
+        return
+    # Ответ и запись состояния независимы - выполняем одновременно
+    await asyncio.gather(
+        message.answer("Выберите дату бронирования:", reply_markup=get_current_calendar_keyboard()),
+        state.set_state(BookingStates.waiting_for_date)
     )
-    await state.set_state(BookingStates.waiting_for_date)
 
 
 @router.message(F.text == "📅 Мои брони")
 async def show_my_bookings(message: Message):
     user_id = message.from_user.id
-    bookings = db.get_user_bookings(user_id)
+    bookings = await run_db(db.get_user_bookings, user_id)
 
     if not bookings:
         await message.answer("У вас нет активных броней.")
@@ -1108,32 +1601,33 @@ async def show_my_bookings(message: Message):
     # Если броней 3 или больше - показываем календарь
     if len(bookings) >= 3:
         booked_dates = [b['date'] for b in bookings]
-        now = datetime.now()
+        today = date.today()
 
         await message.answer(
             "📅 <b>Ваши брони</b>\n\n"
             "Выберите дату для просмотра деталей:\n"
             "[15] — забронированный день",
-            reply_markup=get_bookings_calendar_keyboard(now.year, now.month, booked_dates),
-            parse_mode="HTML"
+            reply_markup=get_bookings_calendar_keyboard(today.year, today.month, booked_dates)
         )
     else:
         # Если броней меньше 3 - показываем список как раньше
-        text = "📅 Ваши активные брони:\n\n"
+        lines = ["📅 Ваши активные брони:\n\n"]
         for booking in bookings:
-            booking_icon = "📌" if booking.get('booking_type') == 'permanent' else "•"
-            text += f"{booking_icon} {booking['place_name']} - {booking['date']}"
             if booking.get('booking_type') == 'permanent':
-                text += " (постоянная)"
-            text += "\n"
+                lines.append(f"📌 {booking['place_name']} - {booking['date']} (постоянная)\n")
+            else:
+                lines.append(f"• {booking['place_name']} - {booking['date']}\n")
+        text = "".join(lines)
 
         await message.answer(text)
 
 
 @router.message(F.text == "❌ Отменить бронь")
 async def start_cancel(message: Message, state: FSMContext):
+    if is_repeated_press(message):
+        return
     user_id = message.from_user.id
-    bookings = db.get_user_bookings(user_id)
+    bookings = await run_db(db.get_user_bookings, user_id)
 
     if not bookings:
         await message.answer("У вас нет активных броней для отмены.")
@@ -1142,29 +1636,30 @@ async def start_cancel(message: Message, state: FSMContext):
     # Если броней 3 или больше - показываем календарь, иначе список
     if len(bookings) >= 3:
         booked_dates = [b['date'] for b in bookings]
-        now = datetime.now()
-
-        await message.answer(
+        today = date.today()
+        text = (
             "❌ <b>Отмена брони</b>\n\n"
             "Выберите дату для отмены:\n"
-            "[15] — забронированный день",
-            reply_markup=get_bookings_calendar_keyboard(now.year, now.month, booked_dates),
-            parse_mode="HTML"
+            "[15] — забронированный день"
         )
-        await state.set_state(CancelStates.selecting_booking)
+        reply_markup = get_bookings_calendar_keyboard(today.year, today.month, booked_dates)
     else:
         # Если броней меньше 3 - показываем список
-        await message.answer(
-            "Выберите бронь для отмены:",
-            reply_markup=get_bookings_keyboard(bookings)
-        )
-        await state.set_state(CancelStates.selecting_booking)
+        text = PICK_BOOKING_TO_CANCEL_TEXT
+        reply_markup = get_bookings_keyboard(bookings)
+
+    await asyncio.gather(
+        message.answer(text, reply_markup=reply_markup),
+        state.set_state(CancelStates.selecting_booking)
+    )
 
 
 @router.message(F.text == "🔁 Поменять бронь")
 async def start_change(message: Message, state: FSMContext):
+    if is_repeated_press(message):
+        return
     user_id = message.from_user.id
-    bookings = db.get_user_bookings(user_id)
+    bookings = await run_db(db.get_user_bookings, user_id)
 
     if not bookings:
         await message.answer("У вас нет активных броней для изменения.")
@@ -1173,30 +1668,30 @@ async def start_change(message: Message, state: FSMContext):
     # Если броней 3 или больше - показываем календарь
     if len(bookings) >= 3:
         booked_dates = [b['date'] for b in bookings]
-        now = datetime.now()
-
-        await message.answer(
+        today = date.today()
+        text = (
             "🔁 <b>Изменение брони</b>\n\n"
             "Выберите дату для изменения:\n"
-            "[15] — забронированный день",
-            reply_markup=get_bookings_calendar_keyboard(now.year, now.month, booked_dates),
-            parse_mode="HTML"
+            "[15] — забронированный день"
         )
-        await state.set_state(ChangeStates.selecting_booking)
+        reply_markup = get_bookings_calendar_keyboard(today.year, today.month, booked_dates)
     else:
         # Если броней меньше 3 - показываем список
-        await message.answer(
-            "Выберите бронь, которую хотите изменить:",
-            reply_markup=get_bookings_keyboard(bookings)
-        )
-        await state.set_state(ChangeStates.selecting_booking)
+        text = PICK_BOOKING_TO_CHANGE_TEXT
+        reply_markup = get_bookings_keyboard(bookings)
+
+    await asyncio.gather(
+        message.answer(text, reply_markup=reply_markup),
+        state.set_state(ChangeStates.selecting_booking)
+    )
 
 
 # Обработчики календаря
 @router.callback_query(F.data.startswith("cal_"))
 async def process_calendar_navigation(callback: CallbackQuery):
     try:
-        _, year, month = callback.data.split("_")
+        # partition вместо split: без промежуточного списка на каждый клик
+        year, _, month = callback.data.removeprefix("cal_").partition("_")
         year = int(year)
         month = int(month)
 
@@ -1204,8 +1699,8 @@ async def process_calendar_navigation(callback: CallbackQuery):
             reply_markup=get_calendar_keyboard(year, month)
         )
         await callback.answer()
-    except Exception as e:
-        logger.error(f"Error in calendar navigation: {e}")
+    except HANDLER_ERRORS as e:
+        logger.error("Error in calendar navigation: %s", e)
         await callback.answer("Ошибка навигации", show_alert=True)
 
 
@@ -1225,7 +1720,7 @@ async def ignore_callback(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("booking_cal_"))
 async def process_bookings_calendar_navigation(callback: CallbackQuery, state: FSMContext):
     try:
-        _, _, year, month = callback.data.split("_")
+        year, _, month = callback.data.removeprefix("booking_cal_").partition("_")
         year = int(year)
         month = int(month)
 
@@ -1233,42 +1728,41 @@ async def process_bookings_calendar_navigation(callback: CallbackQuery, state: F
         data = await state.get_data()
 
         # Определяем ID пользователя в зависимости от состояния
-        if current_state in ["AdminStates:selecting_user_booking", "AdminStates:change_for_user_date"]:
+        if current_state in (AdminStates.selecting_user_booking, AdminStates.change_for_user_date):
             user_id = data.get('target_user_id')
         else:
             user_id = callback.from_user.id
 
-        bookings = db.get_user_bookings(user_id)
+        bookings = await run_db(db.get_user_bookings, user_id)
         booked_dates = [b['date'] for b in bookings]
 
         # 📌 Для постоянных броней - показываем только постоянные
-        if current_state in ["AdminStates:view_permanent_user", "AdminStates:delete_permanent_select"]:
+        if current_state in PERMANENT_VIEW_STATES:
             booked_dates = [b['date'] for b in bookings if b.get('booking_type') == 'permanent']
 
         # Определяем текст в зависимости от состояния
-        if current_state == "CancelStates:selecting_booking":
+        if current_state == CancelStates.selecting_booking:
             header = "❌ <b>Отмена брони</b>\n\n"
-        elif current_state == "ChangeStates:selecting_booking":
+        elif current_state == ChangeStates.selecting_booking:
             header = "🔁 <b>Изменение брони</b>\n\n"
-        elif current_state == "AdminStates:selecting_user_booking":
+        elif current_state == AdminStates.selecting_user_booking:
             header = f"👤 <b>Отмена брони пользователя {user_id}</b>\n\n"
-        elif current_state == "AdminStates:change_for_user_date":
+        elif current_state == AdminStates.change_for_user_date:
             header = f"👤 <b>Изменение брони пользователя {user_id}</b>\n\n"
-        elif current_state == "AdminStates:view_permanent_user":
+        elif current_state == AdminStates.view_permanent_user:
             header = f"📌 <b>Постоянные брони пользователя {user_id}</b>\n\n"
-        elif current_state == "AdminStates:delete_permanent_select":
+        elif current_state == AdminStates.delete_permanent_select:
             header = f"📌 <b>Календарь постоянных броней пользователя {user_id}</b>\n\n"
         else:
             header = "📅 <b>Ваши брони</b>\n\n"
 
         await callback.message.edit_text(
-            header + "Выберите дату для просмотра деталей:\n[15] — забронированный день",
-            reply_markup=get_bookings_calendar_keyboard(year, month, booked_dates),
-            parse_mode="HTML"
+            header + PICK_BOOKED_DATE_TEXT,
+            reply_markup=get_bookings_calendar_keyboard(year, month, booked_dates)
         )
         await callback.answer()
-    except Exception as e:
-        logger.error(f"Error in bookings calendar navigation: {e}")
+    except HANDLER_ERRORS as e:
+        logger.error("Error in bookings calendar navigation: %s", e)
         await callback.answer("Ошибка навигации", show_alert=True)
 
 
@@ -1285,41 +1779,39 @@ async def back_to_bookings_calendar(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
 
     # Определяем ID пользователя в зависимости от состояния
-    if current_state in ["AdminStates:selecting_user_booking", "AdminStates:change_for_user_date",
-                         "AdminStates:view_permanent_user", "AdminStates:delete_permanent_select"]:
+    if current_state in TARGET_USER_STATES:
         user_id = data.get('target_user_id')
     else:
         user_id = callback.from_user.id
 
-    bookings = db.get_user_bookings(user_id)
+    bookings = await run_db(db.get_user_bookings, user_id)
     booked_dates = [b['date'] for b in bookings]
 
     # 📌 Для постоянных броней - показываем только постоянные
-    if current_state in ["AdminStates:view_permanent_user", "AdminStates:delete_permanent_select"]:
+    if current_state in PERMANENT_VIEW_STATES:
         booked_dates = [b['date'] for b in bookings if b.get('booking_type') == 'permanent']
 
-    now = datetime.now()
+    today = date.today()
 
     # Определяем заголовок
-    if current_state == "CancelStates:selecting_booking":
+    if current_state == CancelStates.selecting_booking:
         header = "❌ <b>Отмена брони</b>\n\n"
-    elif current_state == "ChangeStates:selecting_booking":
+    elif current_state == ChangeStates.selecting_booking:
         header = "🔁 <b>Изменение брони</b>\n\n"
-    elif current_state == "AdminStates:selecting_user_booking":
+    elif current_state == AdminStates.selecting_user_booking:
         header = f"👤 <b>Отмена брони пользователя {user_id}</b>\n\n"
-    elif current_state == "AdminStates:change_for_user_date":
+    elif current_state == AdminStates.change_for_user_date:
         header = f"👤 <b>Изменение брони пользователя {user_id}</b>\n\n"
-    elif current_state == "AdminStates:view_permanent_user":
+    elif current_state == AdminStates.view_permanent_user:
         header = f"📌 <b>Постоянные брони пользователя {user_id}</b>\n\n"
-    elif current_state == "AdminStates:delete_permanent_select":
+    elif current_state == AdminStates.delete_permanent_select:
         header = f"📌 <b>Календарь постоянных броней пользователя {user_id}</b>\n\n"
     else:
         header = "📅 <b>Ваши брони</b>\n\n"
 
     await callback.message.edit_text(
-        header + "Выберите дату для просмотра деталей:\n[15] — забронированный день",
-        reply_markup=get_bookings_calendar_keyboard(now.year, now.month, booked_dates),
-        parse_mode="HTML"
+        header + PICK_BOOKED_DATE_TEXT,
+        reply_markup=get_bookings_calendar_keyboard(today.year, today.month, booked_dates)
     )
     await callback.answer()
 
@@ -1328,27 +1820,22 @@ async def back_to_bookings_calendar(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("confirm_cancel_booking_"))
 async def confirm_cancel_from_details(callback: CallbackQuery, state: FSMContext):
     try:
-        booking_id = int(callback.data.split("_")[-1])
+        booking_id = int(callback.data.rpartition("_")[2])
         user_id = callback.from_user.id
 
-        booking = db.get_booking_by_id(booking_id)
+        booking = await run_db(db.cancel_booking_returning, booking_id, user_id)
         if not booking:
             await callback.answer("❌ Бронь не найдена", show_alert=True)
             return
 
-        success = db.cancel_booking(booking_id, user_id)
-
-        if success:
-            await callback.message.edit_text(
-                f"✅ Бронь {booking['place_name']} на {booking['date']} отменена."
-            )
-        else:
-            await callback.message.edit_text("❌ Ошибка при отмене.")
+        await callback.message.edit_text(
+            f"✅ Бронь {booking['place_name']} на {booking['date']} отменена."
+        )
 
         await state.clear()
         await callback.answer()
-    except Exception as e:
-        logger.error(f"Error canceling booking: {e}", exc_info=True)
+    except HANDLER_ERRORS as e:
+        logger.error("Error canceling booking: %s", e, exc_info=True)
         await callback.answer("Ошибка", show_alert=True)
 
 
@@ -1356,26 +1843,12 @@ async def confirm_cancel_from_details(callback: CallbackQuery, state: FSMContext
 @router.callback_query(F.data.startswith("confirm_change_booking_"))
 async def confirm_change_from_details(callback: CallbackQuery, state: FSMContext):
     try:
-        booking_id = int(callback.data.split("_")[-1])
-
-        booking = db.get_booking_by_id(booking_id)
-        if not booking:
-            await callback.answer("❌ Бронь не найдена", show_alert=True)
-            return
-
-        await state.update_data(old_booking_id=booking_id)
-
-        now = datetime.now()
-        await callback.message.edit_text(
-            f"Текущая бронь: {booking['place_name']} на {booking['date']}\n\n"
-            "Выберите новую дату:",
-            reply_markup=get_calendar_keyboard(now.year, now.month)
-        )
-
-        await state.set_state(ChangeStates.waiting_for_new_date)
+        booking_id = int(callback.data.rpartition("_")[2])
+        # Тот же сценарий, что и при выборе брони из списка
+        await _change_selected_booking(callback, state, booking_id, ChangeStates.waiting_for_new_date)
         await callback.answer()
-    except Exception as e:
-        logger.error(f"Error starting change: {e}", exc_info=True)
+    except HANDLER_ERRORS as e:
+        logger.error("Error starting change: %s", e, exc_info=True)
         await callback.answer("Ошибка", show_alert=True)
 
 
@@ -1383,11 +1856,11 @@ async def confirm_change_from_details(callback: CallbackQuery, state: FSMContext
 @router.callback_query(F.data.startswith("date_"))
 async def process_date_selection(callback: CallbackQuery, state: FSMContext):
     try:
-        date_str = callback.data.split("_", 1)[1]
+        date_str = callback.data.partition("_")[2]
         current_state = await state.get_state()
         user_id = callback.from_user.id
 
-        logger.info(f"Date selected: {date_str}, state: {current_state}")
+        logger.info("Date selected: %s, state: %s", date_str, current_state)
 
         # Если это просмотр броней по дате (без состояния)
         if not current_state:
@@ -1402,16 +1875,15 @@ async def process_date_selection(callback: CallbackQuery, state: FSMContext):
             )
             return
 
-        # Проверка для обычного бронирования
-        if current_state == "BookingStates:waiting_for_date":
-            if db.has_user_booking_on_date(user_id, date_str):
-                await callback.answer(
-                    f"❌ У вас уже есть бронь на {date_str}.\nИспользуйте '🔁 Поменять бронь'.",
-                    show_alert=True
-                )
-                return
-
-        available_places = db.get_available_places(date_str)
+        # Для обычного бронирования заодно проверяем, нет ли уже брони на эту дату
+        check_user_id = user_id if current_state == BookingStates.waiting_for_date else None
+        already_booked, available_places = await run_db(db.fetch_date_context, check_user_id, date_str)
+        if already_booked:
+            await callback.answer(
+                f"❌ У вас уже есть бронь на {date_str}.\nИспользуйте '🔁 Поменять бронь'.",
+                show_alert=True
+            )
+            return
 
         if not available_places:
             await callback.answer(
@@ -1424,49 +1896,178 @@ async def process_date_selection(callback: CallbackQuery, state: FSMContext):
 
         try:
             await callback.message.delete()
-        except:
+        except TelegramBadRequest:
+            # Сообщение уже удалено или слишком старое
             pass
 
-        if os.path.exists(OFFICE_MAP_PATH):
-            try:
-                photo = FSInputFile(OFFICE_MAP_PATH)
-                await callback.message.answer_photo(
-                    photo=photo,
-                    caption=f"🗺️ Карта офиса\n\nДоступные места на {date_str}:"
-                )
-            except Exception as e:
-                logger.error(f"Error sending image: {e}")
+        await send_office_map(callback.message, f"🗺️ Карта офиса\n\nДоступные места на {date_str}:")
 
         await callback.message.answer(
-            "👇 Выберите место:",
+            PICK_PLACE_TEXT,
             reply_markup=get_places_keyboard(available_places)
         )
 
-        if current_state == "BookingStates:waiting_for_date":
-            await state.set_state(BookingStates.waiting_for_place)
-        elif current_state == "ChangeStates:waiting_for_new_date":
-            await state.set_state(ChangeStates.waiting_for_new_place)
-        elif current_state == "AdminStates:booking_for_user_date":
-            await state.set_state("AdminStates:booking_for_user_place")
-        elif current_state == "AdminStates:change_for_user_place":
-            await state.set_state("AdminStates:change_for_user_confirm")
+        next_state = DATE_SELECTED_NEXT_STATE.get(current_state)
+        if next_state:
+            await state.set_state(next_state)
+
+        await callback.answer()
+
+    except HANDLER_ERRORS as e:
+        logger.error("Error in date selection: %s", e, exc_info=True)
+        await callback.answer("Произошла ошибка", show_alert=True)
+
+
+# Обработчики выбора места (по одному на состояние - маршрутизацию делают фильтры aiogram)
+@router.callback_query(BookingStates.waiting_for_place, F.data.startswith("place_"))
+async def place_for_booking(callback: CallbackQuery, state: FSMContext):
+    try:
+        place_id = int(callback.data.partition("_")[2])
+        data = await state.update_data(place_id=place_id)
+        booking_date = data.get('booking_date')
+
+        await edit_or_answer(
+            callback,
+            f"✅ Вы выбрали Место №{place_id} на {booking_date}.\n\n"
+            "Подтвердить бронь?",
+            reply_markup=get_confirmation_keyboard()
+        )
+
+        await state.set_state(BookingStates.confirming_booking)
+        await callback.answer()
+    except HANDLER_ERRORS as e:
+        logger.error("Error in place selection: %s", e, exc_info=True)
+        await callback.answer("Произошла ошибка", show_alert=True)
+
+
+@router.callback_query(ChangeStates.waiting_for_new_place, F.data.startswith("place_"))
+async def place_for_change(callback: CallbackQuery, state: FSMContext):
+    try:
+        place_id = int(callback.data.partition("_")[2])
+        data = await state.update_data(new_place_id=place_id)
+        new_date = data.get('booking_date')
+        old_booking_id = data.get('old_booking_id')
+
+        # Получаем информацию о старой брони
+        old_booking = await run_db(db.get_booking_by_id, old_booking_id)
+
+        if old_booking:
+            await edit_or_answer(
+                callback,
+                f"🔄 <b>Изменение брони</b>\n\n"
+                f"Меняем:\n"
+                f"📍 <s>{old_booking['place_name']} на {old_booking['date']}</s>\n\n"
+                f"На:\n"
+                f"✅ Место №{place_id} на {new_date}\n\n"
+                f"Подтвердить изменение?",
+                reply_markup=get_confirmation_keyboard()
+            )
+        else:
+            await edit_or_answer(
+                callback,
+                f"✅ Новая бронь: Место №{place_id} на {new_date}.\n\n"
+                "Подтвердить изменение?",
+                reply_markup=get_confirmation_keyboard()
+            )
 
+        await state.set_state(ChangeStates.confirming_change)
         await callback.answer()
+    except HANDLER_ERRORS as e:
+        logger.error("Error in place selection: %s", e, exc_info=True)
+        await callback.answer("Произошла ошибка", show_alert=True)
+
+
+@router.callback_query(AdminStates.booking_for_user_place, F.data.startswith("place_"))
+async def place_for_admin_booking(callback: CallbackQuery, state: FSMContext):
+    try:
+        place_id = int(callback.data.partition("_")[2])
+        data = await state.update_data(place_id=place_id)
+
+        await edit_or_answer(
+            callback,
+            f"Создать бронь для пользователя {data['target_user_id']}:\n"
+            f"Место №{place_id} на {data['booking_date']}?",
+            reply_markup=get_confirmation_keyboard()
+        )
+
+        await state.set_state(AdminStates.booking_for_user_confirm)
+        await callback.answer()
+    except HANDLER_ERRORS as e:
+        logger.error("Error in place selection: %s", e, exc_info=True)
+        await callback.answer("Произошла ошибка", show_alert=True)
+
+
+@router.callback_query(AdminStates.change_for_user_confirm, F.data.startswith("place_"))
+async def place_for_admin_change(callback: CallbackQuery, state: FSMContext):
+    try:
+        place_id = int(callback.data.partition("_")[2])
+        data = await state.update_data(new_place_id=place_id)
+
+        await edit_or_answer(
+            callback,
+            f"Изменить бронь пользователя {data['target_user_id']}:\n"
+            f"Новое место: №{place_id} на {data['booking_date']}?",
+            reply_markup=get_confirmation_keyboard()
+        )
+        await callback.answer()
+    except HANDLER_ERRORS as e:
+        logger.error("Error in place selection: %s", e, exc_info=True)
+        await callback.answer("Произошла ошибка", show_alert=True)
 
-    except Exception as e:
-        logger.error(f"Error in date selection: {e}", exc_info=True)
+
+@router.callback_query(AdminStates.permanent_place_id, F.data.startswith("place_"))
+async def place_for_permanent(callback: CallbackQuery, state: FSMContext):
+    # 📌 Выбор места для постоянной брони
+    try:
+        place_id = int(callback.data.partition("_")[2])
+        await state.update_data(permanent_place_id=place_id)
+
+        await edit_or_answer(
+            callback,
+            f"🪑 Место №{place_id}\n\n"
+            "Выберите дни недели для постоянной брони:",
+            reply_markup=get_weekday_keyboard([])
+        )
+        await state.set_state(AdminStates.permanent_days)
+        await callback.answer()
+    except HANDLER_ERRORS as e:
+        logger.error("Error in place selection: %s", e, exc_info=True)
+        await callback.answer("Произошла ошибка", show_alert=True)
+
+
+@router.callback_query(AdminStates.extend_permanent_edit_place, F.data.startswith("place_"))
+async def place_for_extend_permanent(callback: CallbackQuery, state: FSMContext):
+    # 🔄 Выбор нового места при продлении
+    try:
+        place_id = int(callback.data.partition("_")[2])
+        data = await state.update_data(new_place_id=place_id)
+        current_weekdays = data.get('current_weekdays', [])
+        days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(current_weekdays)])
+
+        await edit_or_answer(
+            callback,
+            f"🪑 Место: №{place_id}\n\n"
+            f"📅 <b>Изменение дней недели</b>\n\n"
+            f"Текущие дни: {days_text}\n\n"
+            f"Выберите новые дни или оставьте текущие:",
+            reply_markup=get_weekday_keyboard(current_weekdays)
+        )
+
+        await state.set_state(AdminStates.extend_permanent_edit_days)
+        await callback.answer()
+    except HANDLER_ERRORS as e:
+        logger.error("Error in place selection: %s", e, exc_info=True)
         await callback.answer("Произошла ошибка", show_alert=True)
 
 
-# Обработчики выбора места
 @router.callback_query(F.data.startswith("place_"))
 async def process_place_selection(callback: CallbackQuery, state: FSMContext):
+    """Выбор места вне сценариев бронирования: просмотр броней по месту"""
     try:
-        place_id = int(callback.data.split("_")[1])
+        place_id = int(callback.data.partition("_")[2])
         current_state = await state.get_state()
-        data = await state.get_data()
 
-        logger.info(f"Place selected: {place_id}, state: {current_state}")
+        logger.info("Place selected: %s, state: %s", place_id, current_state)
 
         # Если это просмотр броней по месту (без состояния)
         if not current_state:
@@ -1481,191 +2082,136 @@ async def process_place_selection(callback: CallbackQuery, state: FSMContext):
             )
             return
 
-        if current_state == "BookingStates:waiting_for_place":
-            booking_date = data.get('booking_date')
-            await state.update_data(place_id=place_id)
-
-            await callback.message.answer(
-                f"✅ Вы выбрали Место №{place_id} на {booking_date}.\n\n"
-                "Подтвердить бронь?",
-                reply_markup=get_confirmation_keyboard()
-            )
-
-            await state.set_state(BookingStates.confirming_booking)
-
-        elif current_state == "ChangeStates:waiting_for_new_place":
-            new_date = data.get('booking_date')
-            old_booking_id = data.get('old_booking_id')
-            await state.update_data(new_place_id=place_id)
-
-            # Получаем информацию о старой брони
-            old_booking = db.get_booking_by_id(old_booking_id)
-
-            if old_booking:
-                await callback.message.answer(
-                    f"🔄 <b>Изменение брони</b>\n\n"
-                    f"Меняем:\n"
-                    f"📍 <s>{old_booking['place_name']} на {old_booking['date']}</s>\n\n"
-                    f"На:\n"
-                    f"✅ Место №{place_id} на {new_date}\n\n"
-                    f"Подтвердить изменение?",
-                    reply_markup=get_confirmation_keyboard(),
-                    parse_mode="HTML"
-                )
-            else:
-                await callback.message.answer(
-                    f"✅ Новая бронь: Место №{place_id} на {new_date}.\n\n"
-                    "Подтвердить изменение?",
-                    reply_markup=get_confirmation_keyboard()
-                )
-
-            await state.set_state(ChangeStates.confirming_change)
-
-        elif current_state == "AdminStates:booking_for_user_place":
-            await state.update_data(place_id=place_id)
-
-            await callback.message.answer(
-                f"Создать бронь для пользователя {data['target_user_id']}:\n"
-                f"Место №{place_id} на {data['booking_date']}?",
-                reply_markup=get_confirmation_keyboard()
-            )
-
-            await state.set_state("AdminStates:booking_for_user_confirm")
+        await callback.answer()
+    except HANDLER_ERRORS as e:
+        logger.error("Error in place selection: %s", e, exc_info=True)
+        await callback.answer("Произошла ошибка", show_alert=True)
 
-        elif current_state == "AdminStates:change_for_user_confirm":
-            await state.update_data(new_place_id=place_id)
 
-            await callback.message.answer(
-                f"Изменить бронь пользователя {data['target_user_id']}:\n"
-                f"Новое место: №{place_id} на {data['booking_date']}?",
-                reply_markup=get_confirmation_keyboard()
-            )
+# Обработчики подтверждения
+@router.callback_query(BookingStates.confirming_booking, F.data == "confirm_yes")
+async def confirm_booking(callback: CallbackQuery, state: FSMContext):
+    # Снимаем часики с кнопки сразу, не дожидаясь записи в БД
+    ack = asyncio.create_task(callback.answer())
+    try:
+        data = await state.get_data()
+        place_id = data.get('place_id')
+        booking_date = data.get('booking_date')
 
-        elif current_state == "AdminStates:permanent_place_id":
-            # 📌 Выбор места для постоянной брони
-            await state.update_data(permanent_place_id=place_id)
+        success = await run_db(db.create_booking, callback.from_user.id, place_id, booking_date)
 
-            await callback.message.answer(
-                f"🪑 Место №{place_id}\n\n"
-                "Выберите дни недели для постоянной брони:",
-                reply_markup=get_weekday_keyboard([])
+        if success:
+            await edit_or_answer(
+                callback,
+                f"✅ Отлично! Место №{place_id} забронировано на {booking_date}."
             )
-            await state.set_state(AdminStates.permanent_days)
-
-        elif current_state == "AdminStates:extend_permanent_edit_place":
-            # 🔄 Выбор нового места при продлении
-            await state.update_data(new_place_id=place_id)
-
-            data = await state.get_data()
-            weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-            current_weekdays = data.get('current_weekdays', [])
-            days_text = ", ".join([weekday_names[d] for d in sorted(current_weekdays)])
-
-            await callback.message.answer(
-                f"🪑 Место: №{place_id}\n\n"
-                f"📅 <b>Изменение дней недели</b>\n\n"
-                f"Текущие дни: {days_text}\n\n"
-                f"Выберите новые дни или оставьте текущие:",
-                reply_markup=get_weekday_keyboard(current_weekdays),
-                parse_mode="HTML"
+        else:
+            await edit_or_answer(
+                callback,
+                "❌ Не удалось создать бронь. Место занято или у вас уже есть бронь на эту дату."
             )
 
-            await state.set_state(AdminStates.extend_permanent_edit_days)
-
-        await callback.answer()
-    except Exception as e:
-        logger.error(f"Error in place selection: {e}", exc_info=True)
-        await callback.answer("Произошла ошибка", show_alert=True)
+        await state.clear()
+    except HANDLER_ERRORS as e:
+        logger.error("Error in confirm: %s", e, exc_info=True)
+    finally:
+        await ack
 
 
-# Обработчики подтверждения
-@router.callback_query(F.data == "confirm_yes")
-async def confirm_action(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(ChangeStates.confirming_change, F.data == "confirm_yes")
+async def confirm_change(callback: CallbackQuery, state: FSMContext):
+    # Снимаем часики с кнопки сразу, не дожидаясь записи в БД
+    ack = asyncio.create_task(callback.answer())
     try:
-        current_state = await state.get_state()
         data = await state.get_data()
-        user_id = callback.from_user.id
-
-        logger.info(f"Confirm: state={current_state}")
-
-        if current_state == "BookingStates:confirming_booking":
-            place_id = data.get('place_id')
-            booking_date = data.get('booking_date')
-
-            success = db.create_booking(user_id, place_id, booking_date)
+        old_booking_id = data.get('old_booking_id')
+        new_place_id = data.get('new_place_id')
+        new_date = data.get('booking_date')
 
-            if success:
-                await callback.message.answer(
-                    f"✅ Отлично! Место №{place_id} забронировано на {booking_date}."
-                )
-            else:
-                await callback.message.answer(
-                    "❌ Не удалось создать бронь. Место занято или у вас уже есть бронь на эту дату."
-                )
+        success = await run_db(db.change_booking, old_booking_id, callback.from_user.id, new_place_id, new_date)
 
-            await state.clear()
+        if success:
+            await edit_or_answer(
+                callback,
+                f"✅ Бронь изменена! Новое место: №{new_place_id} на {new_date}."
+            )
+        else:
+            await edit_or_answer(callback, "❌ Ошибка при изменении брони.")
 
-        elif current_state == "ChangeStates:confirming_change":
-            old_booking_id = data.get('old_booking_id')
-            new_place_id = data.get('new_place_id')
-            new_date = data.get('booking_date')
+        await state.clear()
+    except HANDLER_ERRORS as e:
+        logger.error("Error in confirm: %s", e, exc_info=True)
+    finally:
+        await ack
 
-            db.cancel_booking(old_booking_id, user_id)
-            success = db.create_booking(user_id, new_place_id, new_date)
 
-            if success:
-                await callback.message.answer(
-                    f"✅ Бронь изменена! Новое место: №{new_place_id} на {new_date}."
-                )
-            else:
-                await callback.message.answer("❌ Ошибка при изменении брони.")
+@router.callback_query(AdminStates.booking_for_user_confirm, F.data == "confirm_yes")
+async def confirm_admin_booking(callback: CallbackQuery, state: FSMContext):
+    # Снимаем часики с кнопки сразу, не дожидаясь записи в БД
+    ack = asyncio.create_task(callback.answer())
+    try:
+        data = await state.get_data()
+        target_user_id = data.get('target_user_id')
+        place_id = data.get('place_id')
+        booking_date = data.get('booking_date')
 
-            await state.clear()
+        success = await run_db(db.create_booking_for_user, callback.from_user.id, target_user_id,
+                               place_id, booking_date)
 
-        elif current_state == "AdminStates:booking_for_user_confirm":
-            target_user_id = data.get('target_user_id')
-            place_id = data.get('place_id')
-            booking_date = data.get('booking_date')
+        if success:
+            await edit_or_answer(
+                callback,
+                f"✅ Бронь создана для пользователя {target_user_id}:\n"
+                f"Место №{place_id} на {booking_date}"
+            )
+        else:
+            await edit_or_answer(callback, "❌ Ошибка. Место уже занято.")
 
-            success = db.create_booking_for_user(user_id, target_user_id, place_id, booking_date)
+        await state.clear()
+    except HANDLER_ERRORS as e:
+        logger.error("Error in confirm: %s", e, exc_info=True)
+    finally:
+        await ack
 
-            if success:
-                await callback.message.answer(
-                    f"✅ Бронь создана для пользователя {target_user_id}:\n"
-                    f"Место №{place_id} на {booking_date}"
-                )
-            else:
-                await callback.message.answer("❌ Ошибка. Место уже занято.")
 
-            await state.clear()
+@router.callback_query(AdminStates.change_for_user_confirm, F.data == "confirm_yes")
+async def confirm_admin_change(callback: CallbackQuery, state: FSMContext):
+    # Снимаем часики с кнопки сразу, не дожидаясь записи в БД
+    ack = asyncio.create_task(callback.answer())
+    try:
+        data = await state.get_data()
+        old_booking_id = data.get('old_booking_id')
+        target_user_id = data.get('target_user_id')
+        new_place_id = data.get('new_place_id')
+        new_date = data.get('booking_date')
 
-        elif current_state == "AdminStates:change_for_user_confirm":
-            old_booking_id = data.get('old_booking_id')
-            target_user_id = data.get('target_user_id')
-            new_place_id = data.get('new_place_id')
-            new_date = data.get('booking_date')
+        success = await run_db(db.change_booking_for_user, old_booking_id, target_user_id, new_place_id, new_date)
 
-            db.cancel_booking_admin(old_booking_id)
-            success = db.create_booking_for_user(user_id, target_user_id, new_place_id, new_date)
+        if success:
+            await edit_or_answer(
+                callback,
+                f"✅ Бронь изменена для пользователя {target_user_id}:\n"
+                f"Место №{new_place_id} на {new_date}"
+            )
+        else:
+            await edit_or_answer(callback, "❌ Ошибка при изменении.")
 
-            if success:
-                await callback.message.answer(
-                    f"✅ Бронь изменена для пользователя {target_user_id}:\n"
-                    f"Место №{new_place_id} на {new_date}"
-                )
-            else:
-                await callback.message.answer("❌ Ошибка при изменении.")
+        await state.clear()
+    except HANDLER_ERRORS as e:
+        logger.error("Error in confirm: %s", e, exc_info=True)
+    finally:
+        await ack
 
-            await state.clear()
 
-        await callback.answer()
-    except Exception as e:
-        logger.error(f"Error in confirm: {e}", exc_info=True)
+@router.callback_query(F.data == "confirm_yes")
+async def confirm_action(callback: CallbackQuery):
+    # Подтверждение вне сценария (устаревшая кнопка) - просто закрываем запрос
+    await callback.answer()
 
 
 @router.callback_query(F.data == "confirm_cancel")
 async def cancel_action(callback: CallbackQuery, state: FSMContext):
-    await callback.message.answer("❌ Действие отменено.")
+    await edit_or_answer(callback, "❌ Действие отменено.")
     await state.clear()
     await callback.answer()
 
@@ -1676,26 +2222,28 @@ async def change_selection(callback: CallbackQuery, state: FSMContext):
         current_state = await state.get_state()
         data = await state.get_data()
 
-        if current_state in ["BookingStates:confirming_booking", "AdminStates:booking_for_user_confirm"]:
+        if current_state in (BookingStates.confirming_booking, AdminStates.booking_for_user_confirm):
             booking_date = data.get('booking_date')
-            available_places = db.get_available_places(booking_date)
+            available_places = await run_db(db.get_available_places, booking_date)
 
-            await callback.message.answer(
+            await edit_or_answer(
+                callback,
                 f"Выберите другое место на {booking_date}:",
                 reply_markup=get_places_keyboard(available_places)
             )
 
-            if current_state == "BookingStates:confirming_booking":
+            if current_state == BookingStates.confirming_booking:
                 await state.set_state(BookingStates.waiting_for_place)
             else:
-                await state.set_state("AdminStates:booking_for_user_place")
+                await state.set_state(AdminStates.booking_for_user_place)
 
-        elif current_state == "ChangeStates:confirming_change":
+        elif current_state == ChangeStates.confirming_change:
             # Возврат к выбору нового места
             new_date = data.get('booking_date')
-            available_places = db.get_available_places(new_date)
+            available_places = await run_db(db.get_available_places, new_date)
 
-            await callback.message.answer(
+            await edit_or_answer(
+                callback,
                 f"Выберите другое место на {new_date}:",
                 reply_markup=get_places_keyboard(available_places)
             )
@@ -1703,76 +2251,87 @@ async def change_selection(callback: CallbackQuery, state: FSMContext):
             await state.set_state(ChangeStates.waiting_for_new_place)
 
         await callback.answer()
-    except Exception as e:
-        logger.error(f"Error in change: {e}", exc_info=True)
+    except HANDLER_ERRORS as e:
+        logger.error("Error in change: %s", e, exc_info=True)
 
 
 # Обработчики броней
-@router.callback_query(F.data.startswith("booking_"))
-async def process_booking_action(callback: CallbackQuery, state: FSMContext):
-    try:
-        booking_id = int(callback.data.split("_")[1])
-        user_id = callback.from_user.id
-        current_state = await state.get_state()
+async def _cancel_selected_booking(callback: CallbackQuery, state: FSMContext, booking_id: int,
+                                   owner_id: Optional[int]):
+    # Бронь возвращает сам UPDATE, отдельное чтение не нужно
+    booking = await run_db(db.cancel_booking_returning, booking_id, owner_id)
+
+    if booking:
+        if owner_id is None:
+            text = f"✅ Бронь отменена: {booking['place_name']} на {booking['date']}"
+        else:
+            text = f"✅ Бронь {booking['place_name']} на {booking['date']} отменена."
+        await edit_or_answer(callback, text)
+    else:
+        await edit_or_answer(callback, "❌ Бронь не найдена.")
 
-        booking = db.get_booking_by_id(booking_id)
-        if not booking:
-            await callback.message.answer("❌ Бронь не найдена.")
-            await state.clear()
-            await callback.answer()
-            return
+    await state.clear()
 
-        if current_state == "CancelStates:selecting_booking":
-            success = db.cancel_booking(booking_id, user_id)
 
-            if success:
-                await callback.message.answer(
-                    f"✅ Бронь {booking['place_name']} на {booking['date']} отменена."
-                )
-            else:
-                await callback.message.answer("❌ Ошибка при отмене.")
+async def _change_selected_booking(callback: CallbackQuery, state: FSMContext, booking_id: int,
+                                   next_state: State):
+    booking = await run_db(db.get_booking_by_id, booking_id)
+    if not booking:
+        await edit_or_answer(callback, "❌ Бронь не найдена.")
+        await state.clear()
+        return
 
-            await state.clear()
+    await state.update_data(old_booking_id=booking_id)
 
-        elif current_state == "ChangeStates:selecting_booking":
-            await state.update_data(old_booking_id=booking_id)
+    await edit_or_answer(
+        callback,
+        f"Текущая бронь: {booking['place_name']} на {booking['date']}\n\n"
+        "Выберите новую дату:",
+        reply_markup=get_current_calendar_keyboard()
+    )
 
-            now = datetime.now()
-            await callback.message.answer(
-                f"Текущая бронь: {booking['place_name']} на {booking['date']}\n\n"
-                "Выберите новую дату:",
-                reply_markup=get_calendar_keyboard(now.year, now.month)
-            )
+    await state.set_state(next_state)
 
-            await state.set_state(ChangeStates.waiting_for_new_date)
 
-        elif current_state == "AdminStates:selecting_user_booking":
-            success = db.cancel_booking_admin(booking_id)
+async def _user_cancel_booking(callback: CallbackQuery, state: FSMContext, booking_id: int):
+    await _cancel_selected_booking(callback, state, booking_id, callback.from_user.id)
 
-            if success:
-                await callback.message.answer(
-                    f"✅ Бронь отменена: {booking['place_name']} на {booking['date']}"
-                )
-            else:
-                await callback.message.answer("❌ Ошибка при отмене.")
 
-            await state.clear()
+async def _admin_cancel_booking(callback: CallbackQuery, state: FSMContext, booking_id: int):
+    await _cancel_selected_booking(callback, state, booking_id, None)
 
-        elif current_state == "AdminStates:change_for_user_date":
-            await state.update_data(old_booking_id=booking_id)
 
-            now = datetime.now()
-            await callback.message.answer(
-                f"Текущая бронь: {booking['place_name']} на {booking['date']}\n\n"
-                "Выберите новую дату:",
-                reply_markup=get_calendar_keyboard(now.year, now.month)
-            )
+async def _user_change_booking(callback: CallbackQuery, state: FSMContext, booking_id: int):
+    await _change_selected_booking(callback, state, booking_id, ChangeStates.waiting_for_new_date)
 
-            await state.set_state("AdminStates:change_for_user_place")
 
-        await callback.answer()
-    except Exception as e:
-        logger.error(f"Error in booking action: {e}", exc_info=True)
+async def _admin_change_booking(callback: CallbackQuery, state: FSMContext, booking_id: int):
+    await _change_selected_booking(callback, state, booking_id, AdminStates.change_for_user_place)
+
+
+# Действие с выбранной бронью в зависимости от текущего состояния
+BOOKING_ACTIONS = {
+    CancelStates.selecting_booking.state: _user_cancel_booking,
+    ChangeStates.selecting_booking.state: _user_change_booking,
+    AdminStates.selecting_user_booking.state: _admin_cancel_booking,
+    AdminStates.change_for_user_date.state: _admin_change_booking,
+}
+
+
+@router.callback_query(F.data.startswith("booking_"))
+async def process_booking_action(callback: CallbackQuery, state: FSMContext):
+    # Снимаем часики с кнопки сразу, не дожидаясь записи в БД
+    ack = asyncio.create_task(callback.answer())
+    try:
+        booking_id = int(callback.data.partition("_")[2])
+        action = BOOKING_ACTIONS.get(await state.get_state())
+
+        if action:
+            await action(callback, state, booking_id)
+    except HANDLER_ERRORS as e:
+        logger.error("Error in booking action: %s", e, exc_info=True)
+    finally:
+        await ack
 
 
 # 🆕 Обработчик кликов по календарю в админских состояниях для отмены/изменения
@@ -1785,14 +2344,13 @@ async def view_booking_details_universal(callback: CallbackQuery, state: FSMCont
         data = await state.get_data()
 
         # Определяем ID пользователя в зависимости от состояния
-        if current_state in ["AdminStates:selecting_user_booking", "AdminStates:change_for_user_date",
-                             "AdminStates:view_permanent_user", "AdminStates:delete_permanent_select"]:
+        if current_state in TARGET_USER_STATES:
             user_id = data.get('target_user_id')
         else:
             user_id = callback.from_user.id
 
         # Получаем все брони пользователя
-        bookings = db.get_user_bookings(user_id)
+        bookings = await run_db(db.get_user_bookings, user_id)
 
         # Находим бронь на эту дату
         booking = None
@@ -1818,17 +2376,15 @@ async def view_booking_details_universal(callback: CallbackQuery, state: FSMCont
 
         # Если это постоянная бронь, добавляем информацию о постоянной брони
         if booking.get('booking_type') == 'permanent' and booking.get('permanent_booking_id'):
-            permanent_bookings = db.get_permanent_bookings(user_id)
+            permanent_bookings = await run_db(db.get_permanent_bookings, user_id)
             for pb in permanent_bookings:
                 if pb['id'] == booking['permanent_booking_id']:
-                    weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-                    days_text = ", ".join([weekday_names[d] for d in sorted(pb['weekdays'])])
+                    days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(pb['weekdays'])])
                     text += f"\n🔄 Повторяется: {days_text}"
                     break
 
         # Добавляем информацию о пользователе для админа
-        if current_state in ["AdminStates:selecting_user_booking", "AdminStates:change_for_user_date",
-                             "AdminStates:view_permanent_user", "AdminStates:delete_permanent_select"]:
+        if current_state in TARGET_USER_STATES:
             text = f"👤 <b>Пользователь ID: {user_id}</b>\n\n" + text
 
         # Формируем кнопки действий
@@ -1836,19 +2392,19 @@ async def view_booking_details_universal(callback: CallbackQuery, state: FSMCont
         await state.update_data(selected_booking_id=booking['id'])
 
         # Кнопки в зависимости от состояния
-        if current_state == "CancelStates:selecting_booking":
+        if current_state == CancelStates.selecting_booking:
             buttons.append([InlineKeyboardButton(text="❌ Отменить эту бронь",
                                                  callback_data=f"confirm_cancel_booking_{booking['id']}")])
-        elif current_state == "ChangeStates:selecting_booking":
+        elif current_state == ChangeStates.selecting_booking:
             buttons.append([InlineKeyboardButton(text="🔁 Изменить эту бронь",
                                                  callback_data=f"confirm_change_booking_{booking['id']}")])
-        elif current_state == "AdminStates:selecting_user_booking":
+        elif current_state == AdminStates.selecting_user_booking:
             buttons.append([InlineKeyboardButton(text="❌ Отменить эту бронь",
                                                  callback_data=f"booking_{booking['id']}")])
-        elif current_state == "AdminStates:change_for_user_date":
+        elif current_state == AdminStates.change_for_user_date:
             buttons.append([InlineKeyboardButton(text="🔁 Изменить эту бронь",
                                                  callback_data=f"booking_{booking['id']}")])
-        elif current_state in ["AdminStates:view_permanent_user", "AdminStates:delete_permanent_select"]:
+        elif current_state in PERMANENT_VIEW_STATES:
             # Для постоянных броней - только просмотр, без действий
             pass
         else:
@@ -1863,13 +2419,12 @@ async def view_booking_details_universal(callback: CallbackQuery, state: FSMCont
 
         await callback.message.edit_text(
             text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
-            parse_mode="HTML"
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
         )
         await callback.answer()
 
-    except Exception as e:
-        logger.error(f"Error viewing booking details: {e}", exc_info=True)
+    except HANDLER_ERRORS as e:
+        logger.error("Error viewing booking details: %s", e, exc_info=True)
         await callback.answer("Ошибка при просмотре деталей", show_alert=True)
 
 
@@ -1881,9 +2436,8 @@ async def admin_panel(message: Message):
         return
 
     await message.answer(
-        "🔒 <b>Админ-панель</b>\n\nВыберите действие:",
-        reply_markup=get_admin_panel_keyboard(),
-        parse_mode="HTML"
+        ADMIN_PANEL_TEXT,
+        reply_markup=get_admin_panel_keyboard()
     )
 
 
@@ -1894,17 +2448,10 @@ async def admin_show_all_bookings(callback: CallbackQuery):
         return
 
     # Показываем меню выбора способа просмотра
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📅 Посмотреть по дате", callback_data="bookings_by_date")],
-        [InlineKeyboardButton(text="🪑 Посмотреть по столу", callback_data="bookings_by_place")],
-        [InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back_to_main")]
-    ])
-
     await callback.message.edit_text(
         "📋 <b>Просмотр активных броней</b>\n\n"
         "Выберите способ просмотра:",
-        reply_markup=keyboard,
-        parse_mode="HTML"
+        reply_markup=BOOKINGS_VIEW_MENU
     )
     await callback.answer()
 
@@ -1916,14 +2463,11 @@ async def bookings_by_date_start(callback: CallbackQuery):
         await callback.answer("❌ Нет прав", show_alert=True)
         return
 
-    now = datetime.now()
-
     # Показываем календарь для выбора даты
     await callback.message.edit_text(
         "📅 <b>Просмотр броней по дате</b>\n\n"
         "Выберите дату для просмотра:",
-        reply_markup=get_calendar_keyboard(now.year, now.month),
-        parse_mode="HTML"
+        reply_markup=get_current_calendar_keyboard()
     )
     await callback.answer()
 
@@ -1937,7 +2481,7 @@ async def admin_view_bookings_for_date(callback: CallbackQuery):
     date_str = callback.data.split("admin_view_date_")[1]
 
     # Получаем все будущие брони
-    all_bookings = db.get_all_bookings(future_only=True)
+    all_bookings = await run_db_shared(("all_bookings", True), db.get_all_bookings, future_only=True)
 
     # Фильтруем брони на эту дату
     date_bookings = [b for b in all_bookings if b['date'] == date_str]
@@ -1946,10 +2490,7 @@ async def admin_view_bookings_for_date(callback: CallbackQuery):
         await callback.message.edit_text(
             f"📅 <b>Брони на {date_str}</b>\n\n"
             f"❌ Нет броней на эту дату.",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Назад", callback_data="bookings_by_date")]
-            ]),
-            parse_mode="HTML"
+            reply_markup=BACK_TO_DATES_KEYBOARD
         )
         await callback.answer()
         return
@@ -1957,21 +2498,19 @@ async def admin_view_bookings_for_date(callback: CallbackQuery):
     # Сортируем по номеру места
     date_bookings.sort(key=lambda x: x['place_id'])
 
-    text = f"📅 <b>Брони на {date_str}</b>\n\n"
+    lines = [f"📅 <b>Брони на {date_str}</b>\n\n"]
 
     for booking in date_bookings:
         user_display = f"@{booking['username']}" if booking['username'] else booking['first_name']
         booking_type = " 📌" if booking.get('booking_type') == 'permanent' else ""
-        text += f"🪑 <b>Место №{booking['place_id']}</b> → {user_display}{booking_type}\n"
+        lines.append(f"🪑 <b>Место №{booking['place_id']}</b> → {user_display}{booking_type}\n")
 
-    text += f"\n━━━━━━━━━━━━━━━━━━━\n📊 Всего: {len(date_bookings)} броней"
+    lines.append(f"\n━━━━━━━━━━━━━━━━━━━\n📊 Всего: {len(date_bookings)} броней")
+    text = "".join(lines)
 
     await callback.message.edit_text(
         text,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="◀️ Назад", callback_data="bookings_by_date")]
-        ]),
-        parse_mode="HTML"
+        reply_markup=BACK_TO_DATES_KEYBOARD
     )
     await callback.answer()
 
@@ -1989,8 +2528,7 @@ async def bookings_by_place_start(callback: CallbackQuery):
     await callback.message.edit_text(
         "🪑 <b>Просмотр броней по столу</b>\n\n"
         "Выберите место:",
-        reply_markup=get_places_keyboard(all_places),
-        parse_mode="HTML"
+        reply_markup=get_places_keyboard(all_places)
     )
     await callback.answer()
 
@@ -2004,7 +2542,7 @@ async def admin_view_bookings_for_place(callback: CallbackQuery):
     place_id = int(callback.data.split("admin_view_place_")[1])
 
     # Получаем все будущие брони
-    all_bookings = db.get_all_bookings(future_only=True)
+    all_bookings = await run_db_shared(("all_bookings", True), db.get_all_bookings, future_only=True)
 
     # Фильтруем только брони для этого места
     place_bookings = [b for b in all_bookings if b['place_id'] == place_id]
@@ -2013,34 +2551,28 @@ async def admin_view_bookings_for_place(callback: CallbackQuery):
         await callback.message.edit_text(
             f"🪑 <b>Место №{place_id}</b>\n\n"
             f"❌ Нет будущих броней для этого места.",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Назад", callback_data="bookings_by_place")]
-            ]),
-            parse_mode="HTML"
+            reply_markup=BACK_TO_PLACES_KEYBOARD
         )
         await callback.answer()
         return
 
     # Сортируем по дате (уже отсортировано в БД, но на всякий случай)
-    place_bookings.sort(key=lambda x: datetime.strptime(x['date'], "%d.%m.%Y"))
+    place_bookings.sort(key=lambda x: parse_date(x['date']))
 
-    text = f"🪑 <b>Место №{place_id}</b>\n\n"
-    text += f"📋 Будущие брони:\n\n"
+    lines = [f"🪑 <b>Место №{place_id}</b>\n\n📋 Будущие брони:\n\n"]
 
     for booking in place_bookings:
         user_display = f"@{booking['username']}" if booking['username'] else booking['first_name']
         booking_type = " 📌" if booking.get('booking_type') == 'permanent' else ""
 
-        text += f"📅 {booking['date']} → {user_display}{booking_type}\n"
+        lines.append(f"📅 {booking['date']} → {user_display}{booking_type}\n")
 
-    text += f"\n━━━━━━━━━━━━━━━━━━━\n📊 Всего: {len(place_bookings)} броней"
+    lines.append(f"\n━━━━━━━━━━━━━━━━━━━\n📊 Всего: {len(place_bookings)} броней")
+    text = "".join(lines)
 
     await callback.message.edit_text(
         text,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="◀️ Назад", callback_data="bookings_by_place")]
-        ]),
-        parse_mode="HTML"
+        reply_markup=BACK_TO_PLACES_KEYBOARD
     )
     await callback.answer()
 
@@ -2051,17 +2583,10 @@ async def admin_cancel_all_confirm(callback: CallbackQuery):
         await callback.answer("❌ Нет прав", show_alert=True)
         return
 
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="✅ Да, отменить все", callback_data="admin_cancel_all_confirm"),
-            InlineKeyboardButton(text="❌ Отмена", callback_data="admin_cancel_action")
-        ]
-    ])
-
-    await callback.message.answer(
+    await edit_or_answer(
+        callback,
         "⚠️ <b>Внимание!</b>\n\nВы уверены, что хотите отменить ВСЕ брони?",
-        reply_markup=keyboard,
-        parse_mode="HTML"
+        reply_markup=CANCEL_ALL_KEYBOARD
     )
     await callback.answer()
 
@@ -2072,13 +2597,13 @@ async def admin_cancel_all_execute(callback: CallbackQuery):
         await callback.answer("❌ Нет прав", show_alert=True)
         return
 
-    count = db.cancel_all_bookings()
-    await callback.message.answer(
+    # Отмена всех броней может занять время - отвечаем на нажатие параллельно с ней
+    count, _ = await asyncio.gather(run_db(db.cancel_all_bookings), callback.answer())
+    await edit_or_answer(
+        callback,
         f"✅ <b>Отменено записей: {count}</b>\n\n"
-        f"Включая обычные и постоянные брони.",
-        parse_mode="HTML"
+        f"Включая обычные и постоянные брони."
     )
-    await callback.answer()
 
 
 @router.callback_query(F.data == "admin_cancel_user")
@@ -2089,8 +2614,7 @@ async def admin_cancel_user_start(callback: CallbackQuery, state: FSMContext):
 
     await callback.message.answer(
         "🔍 Введите Telegram ID или username пользователя\n"
-        "Например: <code>123456</code> или <code>@username</code>",
-        parse_mode="HTML"
+        "Например: <code>123456</code> или <code>@username</code>"
     )
     await state.set_state(AdminStates.waiting_for_user_identifier)
     await callback.answer()
@@ -2107,12 +2631,12 @@ async def admin_process_user_identifier(message: Message, state: FSMContext):
     try:
         user_id = int(identifier)
     except ValueError:
-        user_id = db.find_user_by_username(identifier)
+        user_id = await run_db(db.find_user_by_username, identifier)
         if not user_id:
             await message.answer("❌ Пользователь не найден.")
             return
 
-    bookings = db.get_user_bookings(user_id)
+    bookings = await run_db(db.get_user_bookings, user_id)
 
     if not bookings:
         await message.answer("У этого пользователя нет активных броней.")
@@ -2124,18 +2648,17 @@ async def admin_process_user_identifier(message: Message, state: FSMContext):
     # 📅 Если броней 3+, показываем календарь, иначе список
     if len(bookings) >= 3:
         booked_dates = [b['date'] for b in bookings]
-        now = datetime.now()
+        today = date.today()
 
         await message.answer(
             f"👤 <b>Отмена брони пользователя {user_id}</b>\n\n"
             "Выберите дату для отмены:\n"
             "[15] — забронированный день",
-            reply_markup=get_bookings_calendar_keyboard(now.year, now.month, booked_dates),
-            parse_mode="HTML"
+            reply_markup=get_bookings_calendar_keyboard(today.year, today.month, booked_dates)
         )
     else:
         await message.answer(
-            "Выберите бронь для отмены:",
+            PICK_BOOKING_TO_CANCEL_TEXT,
             reply_markup=get_bookings_keyboard(bookings)
         )
 
@@ -2150,8 +2673,7 @@ async def admin_book_for_user_start(callback: CallbackQuery, state: FSMContext):
 
     await callback.message.answer(
         "🔍 Введите Telegram ID или username пользователя\n"
-        "Например: <code>123456</code> или <code>@username</code>",
-        parse_mode="HTML"
+        "Например: <code>123456</code> или <code>@username</code>"
     )
     await state.set_state(AdminStates.booking_for_user_date)
     await callback.answer()
@@ -2168,17 +2690,16 @@ async def admin_book_for_user_get_user(message: Message, state: FSMContext):
     try:
         user_id = int(identifier)
     except ValueError:
-        user_id = db.find_user_by_username(identifier)
+        user_id = await run_db(db.find_user_by_username, identifier)
         if not user_id:
             await message.answer("❌ Пользователь не найден.")
             return
 
     await state.update_data(target_user_id=user_id)
 
-    now = datetime.now()
     await message.answer(
         f"Бронирование для пользователя ID: {user_id}\nВыберите дату:",
-        reply_markup=get_calendar_keyboard(now.year, now.month)
+        reply_markup=get_current_calendar_keyboard()
     )
 
 
@@ -2190,8 +2711,7 @@ async def admin_change_for_user_start(callback: CallbackQuery, state: FSMContext
 
     await callback.message.answer(
         "🔍 Введите Telegram ID или username пользователя\n"
-        "Например: <code>123456</code> или <code>@username</code>",
-        parse_mode="HTML"
+        "Например: <code>123456</code> или <code>@username</code>"
     )
     await state.set_state(AdminStates.change_for_user_select)
     await callback.answer()
@@ -2208,12 +2728,12 @@ async def admin_change_for_user_select_booking(message: Message, state: FSMConte
     try:
         user_id = int(identifier)
     except ValueError:
-        user_id = db.find_user_by_username(identifier)
+        user_id = await run_db(db.find_user_by_username, identifier)
         if not user_id:
             await message.answer("❌ Пользователь не найден.")
             return
 
-    bookings = db.get_user_bookings(user_id)
+    bookings = await run_db(db.get_user_bookings, user_id)
 
     if not bookings:
         await message.answer("У этого пользователя нет активных броней.")
@@ -2225,14 +2745,13 @@ async def admin_change_for_user_select_booking(message: Message, state: FSMConte
     # 📅 Если броней 3+, показываем календарь, иначе список
     if len(bookings) >= 3:
         booked_dates = [b['date'] for b in bookings]
-        now = datetime.now()
+        today = date.today()
 
         await message.answer(
             f"👤 <b>Изменение брони пользователя {user_id}</b>\n\n"
             "Выберите дату для изменения:\n"
             "[15] — забронированный день",
-            reply_markup=get_bookings_calendar_keyboard(now.year, now.month, booked_dates),
-            parse_mode="HTML"
+            reply_markup=get_bookings_calendar_keyboard(today.year, today.month, booked_dates)
         )
     else:
         await message.answer(
@@ -2251,23 +2770,13 @@ async def admin_change_map_start(callback: CallbackQuery, state: FSMContext):
         return
 
     # Показываем текущую карту, если она есть
-    if os.path.exists(OFFICE_MAP_PATH):
-        try:
-            photo = FSInputFile(OFFICE_MAP_PATH)
-            await callback.message.answer_photo(
-                photo=photo,
-                caption="📸 <b>Текущая карта офиса</b>",
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logger.error(f"Error showing current map: {e}")
+    await send_office_map(callback.message, "📸 <b>Текущая карта офиса</b>")
 
     await callback.message.answer(
         "🗺️ <b>Замена карты офиса</b>\n\n"
         "Отправьте новое изображение карты офиса.\n"
         "Принимаются только фото (PNG, JPG).\n\n"
-        "Для отмены напишите /cancel",
-        parse_mode="HTML"
+        "Для отмены напишите /cancel"
     )
 
     await state.set_state(AdminStates.waiting_for_map_photo)
@@ -2276,6 +2785,8 @@ async def admin_change_map_start(callback: CallbackQuery, state: FSMContext):
 
 @router.message(AdminStates.waiting_for_map_photo)
 async def admin_change_map_process(message: Message, state: FSMContext):
+    global OFFICE_MAP, OFFICE_MAP_FILE_ID
+
     if not is_admin(message.from_user.id):
         await state.clear()
         return
@@ -2292,8 +2803,7 @@ async def admin_change_map_process(message: Message, state: FSMContext):
             "⚠️ <b>Неверный формат</b>\n\n"
             "Пожалуйста, отправьте <b>фото или файл изображения</b>.\n"
             "Поддерживаются форматы: JPG, PNG, HEIC, WEBP\n\n"
-            "Для отмены напишите /cancel",
-            parse_mode="HTML"
+            "Для отмены напишите /cancel"
         )
         return
 
@@ -2303,15 +2813,16 @@ async def admin_change_map_process(message: Message, state: FSMContext):
         # Создаём резервную копию старой карты
         if os.path.exists(OFFICE_MAP_PATH):
             backup_path = f"office_map_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-            shutil.copy2(OFFICE_MAP_PATH, backup_path)
-            logger.info(f"Backup created: {backup_path}")
+            # Копирование файла блокирует - выполняем в потоке, как и запросы к БД
+            await asyncio.to_thread(shutil.copy2, OFFICE_MAP_PATH, backup_path)
+            logger.info("Backup created: %s", backup_path)
 
         # Получаем файл
         if message.photo:
             # Если отправлено как фото (сжатое)
             photo = message.photo[-1]  # Берём максимальное разрешение
             file = await bot.get_file(photo.file_id)
-            logger.info(f"Received photo: {file.file_path}")
+            logger.info("Received photo: %s", file.file_path)
         elif message.document:
             # Если отправлено как документ (без сжатия)
             doc = message.document
@@ -2322,13 +2833,12 @@ async def admin_change_map_process(message: Message, state: FSMContext):
                 await message.answer(
                     f"❌ <b>Неподдерживаемый формат файла</b>\n\n"
                     f"Получен: {doc.mime_type}\n"
-                    f"Поддерживаются только изображения (JPG, PNG, HEIC, WEBP)",
-                    parse_mode="HTML"
+                    f"Поддерживаются только изображения (JPG, PNG, HEIC, WEBP)"
                 )
                 return
 
             file = await bot.get_file(doc.file_id)
-            logger.info(f"Received document: {file.file_path}, mime: {doc.mime_type}")
+            logger.info("Received document: %s, mime: %s", file.file_path, doc.mime_type)
 
         # Скачиваем файл во временное место
         temp_path = f"temp_map_{message.from_user.id}.tmp"
@@ -2336,29 +2846,31 @@ async def admin_change_map_process(message: Message, state: FSMContext):
 
         # Переименовываем во финальное имя
         if os.path.exists(temp_path):
-            shutil.move(temp_path, OFFICE_MAP_PATH)
-            logger.info(f"Office map updated by admin {message.from_user.id}")
+            await asyncio.to_thread(shutil.move, temp_path, OFFICE_MAP_PATH)
+            # Сбрасываем file_id старой карты
+            OFFICE_MAP = FSInputFile(OFFICE_MAP_PATH)
+            OFFICE_MAP_FILE_ID = None
+            logger.info("Office map updated by admin %s", message.from_user.id)
 
         # Показываем новую карту
-        new_photo = FSInputFile(OFFICE_MAP_PATH)
-        await message.answer_photo(
-            photo=new_photo,
+        sent = await message.answer_photo(
+            photo=OFFICE_MAP,
             caption="✅ <b>Карта офиса успешно обновлена!</b>\n\n"
                     "Новая карта будет отображаться при следующем бронировании.\n\n"
                     f"📊 Формат: {message.document.mime_type if message.document else 'JPEG (compressed)'}\n"
-                    f"📏 Размер: {file.file_size / 1024:.1f} KB",
-            parse_mode="HTML"
+                    f"📏 Размер: {(file.file_size or 0) / 1024:.1f} KB"
         )
+        OFFICE_MAP_FILE_ID = sent.photo[-1].file_id
 
         await state.clear()
 
-    except Exception as e:
-        logger.error(f"Error updating office map: {e}", exc_info=True)
+    # OSError - файлы карты, ClientError - скачивание файла с серверов Telegram
+    except (OSError, ClientError, TelegramAPIError) as e:
+        logger.error("Error updating office map: %s", e, exc_info=True)
         await message.answer(
             "❌ <b>Ошибка при обновлении карты</b>\n\n"
             f"Детали: {str(e)}\n\n"
-            "Попробуйте отправить фото в другом формате или как документ.",
-            parse_mode="HTML"
+            "Попробуйте отправить фото в другом формате или как документ."
         )
 
         # Очищаем временный файл если он есть
@@ -2376,7 +2888,7 @@ async def admin_add_admin_start(callback: CallbackQuery, state: FSMContext):
         return
 
     # Получаем список админов с информацией
-    admins_info = db.get_all_admins_with_info()
+    admins_info = await run_db(db.get_all_admins_with_info)
 
     admins_list = []
     for admin in admins_info:
@@ -2389,13 +2901,13 @@ async def admin_add_admin_start(callback: CallbackQuery, state: FSMContext):
 
     admins_text = "\n".join([f"• {info}" for info in admins_list])
 
-    await callback.message.answer(
+    await edit_or_answer(
+        callback,
         f"👤 <b>Добавление администратора</b>\n\n"
         f"Текущие админы:\n{admins_text}\n\n"
         f"Введите Telegram ID или @username нового администратора:\n"
         f"Примеры: <code>123456789</code> или <code>@username</code>\n\n"
-        f"⚠️ Если указываете username, пользователь должен сначала запустить бота командой /start",
-        parse_mode="HTML"
+        f"⚠️ Если указываете username, пользователь должен сначала запустить бота командой /start"
     )
     await state.set_state(AdminStates.adding_admin)
     await callback.answer()
@@ -2403,6 +2915,8 @@ async def admin_add_admin_start(callback: CallbackQuery, state: FSMContext):
 
 @router.message(AdminStates.adding_admin)
 async def admin_add_admin_process(message: Message, state: FSMContext):
+    global ADMIN_IDS
+
     if not is_admin(message.from_user.id):
         await state.clear()
         return
@@ -2415,7 +2929,7 @@ async def admin_add_admin_process(message: Message, state: FSMContext):
         new_admin_id = int(identifier)
     except ValueError:
         # Если не число - это username
-        new_admin_id = db.find_user_by_username(identifier)
+        new_admin_id = await run_db(db.find_user_by_username, identifier)
         if not new_admin_id:
             await message.answer(
                 f"❌ <b>Пользователь не найден</b>\n\n"
@@ -2423,8 +2937,7 @@ async def admin_add_admin_process(message: Message, state: FSMContext):
                 f"• Неверный username\n"
                 f"• Пользователь ещё не запускал бота\n\n"
                 f"💡 Попросите пользователя сначала запустить бота командой /start, "
-                f"затем попробуйте снова или используйте Telegram ID.",
-                parse_mode="HTML"
+                f"затем попробуйте снова или используйте Telegram ID."
             )
             await state.clear()
             return
@@ -2434,19 +2947,18 @@ async def admin_add_admin_process(message: Message, state: FSMContext):
         await message.answer(f"❌ Пользователь {new_admin_id} уже является администратором.")
     else:
         # Добавляем в БД
-        success = db.add_admin(new_admin_id, message.from_user.id)
+        success = await run_db(db.add_admin, new_admin_id, message.from_user.id)
 
         if success:
-            # Добавляем в список в памяти
-            ADMIN_IDS.append(new_admin_id)
+            # Пересобираем множество в памяти
+            ADMIN_IDS = ADMIN_IDS | {new_admin_id}
 
             await message.answer(
                 f"✅ <b>Администратор добавлен!</b>\n\n"
                 f"👤 Telegram ID: <code>{new_admin_id}</code>\n\n"
-                f"Права вступили в силу немедленно!",
-                parse_mode="HTML"
+                f"Права вступили в силу немедленно!"
             )
-            logger.info(f"Admin {new_admin_id} added by {message.from_user.id}")
+            logger.info("Admin %s added by %s", new_admin_id, message.from_user.id)
         else:
             await message.answer("❌ Ошибка при добавлении администратора.")
 
@@ -2460,7 +2972,7 @@ async def admin_remove_admin_start(callback: CallbackQuery, state: FSMContext):
         return
 
     # Получаем список админов с информацией (кроме главного)
-    admins_info = db.get_all_admins_with_info()
+    admins_info = await run_db(db.get_all_admins_with_info)
     removable_admins = [a for a in admins_info if a['telegram_id'] != SUPER_ADMIN_ID]
 
     if not removable_admins:
@@ -2487,12 +2999,12 @@ async def admin_remove_admin_start(callback: CallbackQuery, state: FSMContext):
     else:
         super_display = f"ID: {SUPER_ADMIN_ID}"
 
-    await callback.message.answer(
+    await edit_or_answer(
+        callback,
         f"🗑 <b>Удаление администратора</b>\n\n"
         f"Админы (доступны для удаления):\n{admins_text}\n\n"
         f"⚠️ <b>Мама бота</b> ({super_display}, ID: <code>{SUPER_ADMIN_ID}</code>) защищена\n\n"
-        f"Введите Telegram ID или @username для удаления:",
-        parse_mode="HTML"
+        f"Введите Telegram ID или @username для удаления:"
     )
     await state.set_state(AdminStates.removing_admin)
     await callback.answer()
@@ -2500,6 +3012,8 @@ async def admin_remove_admin_start(callback: CallbackQuery, state: FSMContext):
 
 @router.message(AdminStates.removing_admin)
 async def admin_remove_admin_process(message: Message, state: FSMContext):
+    global ADMIN_IDS
+
     if not is_admin(message.from_user.id):
         await state.clear()
         return
@@ -2512,12 +3026,11 @@ async def admin_remove_admin_process(message: Message, state: FSMContext):
         remove_admin_id = int(identifier)
     except ValueError:
         # Если не число - это username
-        remove_admin_id = db.find_user_by_username(identifier)
+        remove_admin_id = await run_db(db.find_user_by_username, identifier)
         if not remove_admin_id:
             await message.answer(
                 f"❌ <b>Пользователь не найден</b>\n\n"
-                f"Проверьте правильность username или используйте Telegram ID.",
-                parse_mode="HTML"
+                f"Проверьте правильность username или используйте Telegram ID."
             )
             await state.clear()
             return
@@ -2529,19 +3042,18 @@ async def admin_remove_admin_process(message: Message, state: FSMContext):
         await message.answer(f"❌ Пользователь {remove_admin_id} не является администратором.")
     else:
         # Удаляем из БД
-        success = db.remove_admin(remove_admin_id)
+        success = await run_db(db.remove_admin, remove_admin_id)
 
         if success:
-            # Удаляем из списка в памяти
-            ADMIN_IDS.remove(remove_admin_id)
+            # Пересобираем множество в памяти
+            ADMIN_IDS = ADMIN_IDS - {remove_admin_id}
 
             await message.answer(
                 f"✅ <b>Администратор удалён!</b>\n\n"
                 f"👤 Telegram ID: <code>{remove_admin_id}</code>\n\n"
-                f"Права отозваны немедленно!",
-                parse_mode="HTML"
+                f"Права отозваны немедленно!"
             )
-            logger.info(f"Admin {remove_admin_id} removed by {message.from_user.id}")
+            logger.info("Admin %s removed by %s", remove_admin_id, message.from_user.id)
         else:
             await message.answer("❌ Ошибка при удалении администратора.")
 
@@ -2564,8 +3076,7 @@ async def admin_permanent_menu(callback: CallbackQuery):
     await callback.message.edit_text(
         "📌 <b>Постоянные брони</b>\n\n"
         "Управление постоянными бронированиями мест.",
-        reply_markup=get_permanent_bookings_menu(),
-        parse_mode="HTML"
+        reply_markup=get_permanent_bookings_menu()
     )
     await callback.answer()
 
@@ -2573,9 +3084,8 @@ async def admin_permanent_menu(callback: CallbackQuery):
 @router.callback_query(F.data == "admin_back_to_main")
 async def admin_back_to_main(callback: CallbackQuery):
     await callback.message.edit_text(
-        "🔒 <b>Админ-панель</b>\n\nВыберите действие:",
-        reply_markup=get_admin_panel_keyboard(),
-        parse_mode="HTML"
+        ADMIN_PANEL_TEXT,
+        reply_markup=get_admin_panel_keyboard()
     )
     await callback.answer()
 
@@ -2588,8 +3098,7 @@ async def admin_create_permanent_start(callback: CallbackQuery, state: FSMContex
 
     await callback.message.answer(
         "➕ <b>Создание постоянной брони</b>\n\n"
-        "Введите Telegram ID или @username пользователя:",
-        parse_mode="HTML"
+        "Введите Telegram ID или @username пользователя:"
     )
     await state.set_state(AdminStates.permanent_user_id)
     await callback.answer()
@@ -2606,7 +3115,7 @@ async def admin_permanent_get_user(message: Message, state: FSMContext):
     try:
         user_id = int(identifier)
     except ValueError:
-        user_id = db.find_user_by_username(identifier)
+        user_id = await run_db(db.find_user_by_username, identifier)
         if not user_id:
             await message.answer("❌ Пользователь не найден.")
             return
@@ -2614,22 +3123,13 @@ async def admin_permanent_get_user(message: Message, state: FSMContext):
     await state.update_data(permanent_user_id=user_id)
 
     # 🗺️ Показываем карту офиса
-    if os.path.exists(OFFICE_MAP_PATH):
-        try:
-            photo = FSInputFile(OFFICE_MAP_PATH)
-            await message.answer_photo(
-                photo=photo,
-                caption=f"🗺️ Карта офиса\n\nСоздание постоянной брони для пользователя {user_id}"
-            )
-        except Exception as e:
-            logger.error(f"Error sending office map: {e}")
+    await send_office_map(message, f"🗺️ Карта офиса\n\nСоздание постоянной брони для пользователя {user_id}")
 
     # Показываем все доступные места кнопками (1-13)
     all_places = list(range(1, TOTAL_PLACES + 1))
 
     await message.answer(
-        f"👤 Пользователь: ID {user_id}\n\n"
-        "👇 Выберите место:",
+        f"👤 Пользователь: ID {user_id}\n\n{PICK_PLACE_TEXT}",
         reply_markup=get_places_keyboard(all_places)
     )
     await state.set_state(AdminStates.permanent_place_id)
@@ -2644,14 +3144,13 @@ async def admin_permanent_toggle_day(callback: CallbackQuery, state: FSMContext)
 
     if action == "confirm":
         if not selected:
-            await callback.answer("⚠️ Выберите хотя бы один день!", show_alert=True)
+            await callback.answer(NO_WEEKDAYS_TEXT, show_alert=True)
             return
 
         user_id = data.get('permanent_user_id')
         place_id = data.get('permanent_place_id')
 
-        weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        days_text = ", ".join([weekday_names[d] for d in sorted(selected)])
+        days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(selected)])
 
         await callback.message.edit_text(
             f"📌 <b>Подтверждение постоянной брони</b>\n\n"
@@ -2659,13 +3158,7 @@ async def admin_permanent_toggle_day(callback: CallbackQuery, state: FSMContext)
             f"🪑 Место: №{place_id}\n"
             f"📅 Дни: {days_text}\n\n"
             f"Создать постоянную бронь на ближайшие 90 дней?",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="✅ Создать", callback_data="permanent_create_confirm"),
-                    InlineKeyboardButton(text="❌ Отмена", callback_data="permanent_create_cancel")
-                ]
-            ]),
-            parse_mode="HTML"
+            reply_markup=PERMANENT_CREATE_CONFIRM_KEYBOARD
         )
         await state.set_state(AdminStates.permanent_confirm)
         await callback.answer()
@@ -2691,7 +3184,7 @@ async def admin_permanent_toggle_day(callback: CallbackQuery, state: FSMContext)
             reply_markup=get_weekday_keyboard(selected)
         )
         await callback.answer()
-    except:
+    except (ValueError, TelegramBadRequest):
         await callback.answer()
 
 
@@ -2706,19 +3199,17 @@ async def admin_permanent_create_confirm(callback: CallbackQuery, state: FSMCont
     place_id = data.get('permanent_place_id')
     weekdays = data.get('selected_weekdays', [])
 
-    success = db.create_permanent_booking(callback.from_user.id, user_id, place_id, weekdays)
+    success = await run_db(db.create_permanent_booking, callback.from_user.id, user_id, place_id, weekdays)
 
     if success:
-        weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        days_text = ", ".join([weekday_names[d] for d in sorted(weekdays)])
+        days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(weekdays)])
 
         await callback.message.edit_text(
             f"✅ <b>Постоянная бронь создана!</b>\n\n"
             f"👤 Пользователь: ID {user_id}\n"
             f"🪑 Место: №{place_id}\n"
             f"📅 Дни: {days_text}\n\n"
-            f"Автоматически созданы брони на ближайшие 90 дней.",
-            parse_mode="HTML"
+            f"Автоматически созданы брони на ближайшие 90 дней."
         )
     else:
         await callback.message.edit_text(
@@ -2727,8 +3218,7 @@ async def admin_permanent_create_confirm(callback: CallbackQuery, state: FSMCont
             "• У этого пользователя уже есть постоянная бронь на это место\n"
             "• Другой пользователь уже забронировал это место на пересекающиеся дни недели\n"
             "• Место уже занято на выбранные дни недели\n\n"
-            "Проверьте существующие постоянные брони через меню.",
-            parse_mode="HTML"
+            "Проверьте существующие постоянные брони через меню."
         )
 
     await state.clear()
@@ -2748,24 +3238,23 @@ async def admin_view_all_permanent(callback: CallbackQuery):
         await callback.answer("❌ Нет прав", show_alert=True)
         return
 
-    permanent_bookings = db.get_permanent_bookings()
+    permanent_bookings = await run_db(db.get_permanent_bookings)
 
     if not permanent_bookings:
         await callback.message.answer("📋 Постоянных броней нет.")
         await callback.answer()
         return
 
-    weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-
-    text = "📌 <b>Все постоянные брони:</b>\n\n"
+    lines = ["📌 <b>Все постоянные брони:</b>\n\n"]
     for pb in permanent_bookings:
         user_display = f"@{pb['username']}" if pb['username'] else pb['first_name']
-        days_text = ", ".join([weekday_names[d] for d in sorted(pb['weekdays'])])
-        text += (f"• ID {pb['id']}: <b>{pb['place_name']}</b>\n"
-                 f"  👤 {user_display} (ID: {pb['user_id']})\n"
-                 f"  📅 {days_text}\n\n")
+        days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(pb['weekdays'])])
+        lines.append(f"• ID {pb['id']}: <b>{pb['place_name']}</b>\n"
+                     f"  👤 {user_display} (ID: {pb['user_id']})\n"
+                     f"  📅 {days_text}\n\n")
+    text = "".join(lines)
 
-    await callback.message.answer(text, parse_mode="HTML")
+    await callback.message.answer(text)
     await callback.answer()
 
 
@@ -2793,28 +3282,27 @@ async def admin_view_user_permanent_show(message: Message, state: FSMContext):
     try:
         user_id = int(identifier)
     except ValueError:
-        user_id = db.find_user_by_username(identifier)
+        user_id = await run_db(db.find_user_by_username, identifier)
         if not user_id:
             await message.answer("❌ Пользователь не найден.")
             await state.clear()
             return
 
-    permanent_bookings = db.get_permanent_bookings(user_id)
+    permanent_bookings = await run_db(db.get_permanent_bookings, user_id)
 
     if not permanent_bookings:
         await message.answer(f"У пользователя {user_id} нет постоянных броней.")
         await state.clear()
         return
 
-    weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-
-    text = f"📌 <b>Постоянные брони пользователя {user_id}:</b>\n\n"
+    lines = [f"📌 <b>Постоянные брони пользователя {user_id}:</b>\n\n"]
     for pb in permanent_bookings:
-        days_text = ", ".join([weekday_names[d] for d in sorted(pb['weekdays'])])
-        text += (f"• ID {pb['id']}: <b>{pb['place_name']}</b>\n"
-                 f"  📅 {days_text}\n\n")
+        days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(pb['weekdays'])])
+        lines.append(f"• ID {pb['id']}: <b>{pb['place_name']}</b>\n"
+                     f"  📅 {days_text}\n\n")
+    text = "".join(lines)
 
-    await message.answer(text, parse_mode="HTML")
+    await message.answer(text)
     await state.clear()
 
 
@@ -2826,8 +3314,7 @@ async def admin_delete_permanent_start(callback: CallbackQuery, state: FSMContex
 
     await callback.message.answer(
         "🗑️ <b>Удаление постоянной брони</b>\n\n"
-        "Введите Telegram ID или @username пользователя:",
-        parse_mode="HTML"
+        "Введите Telegram ID или @username пользователя:"
     )
     await state.set_state(AdminStates.delete_permanent_user)
     await callback.answer()
@@ -2844,25 +3331,23 @@ async def admin_delete_permanent_select(message: Message, state: FSMContext):
     try:
         user_id = int(identifier)
     except ValueError:
-        user_id = db.find_user_by_username(identifier)
+        user_id = await run_db(db.find_user_by_username, identifier)
         if not user_id:
             await message.answer("❌ Пользователь не найден.")
             await state.clear()
             return
 
-    permanent_bookings = db.get_permanent_bookings(user_id)
+    permanent_bookings = await run_db(db.get_permanent_bookings, user_id)
 
     if not permanent_bookings:
         await message.answer(f"У пользователя {user_id} нет постоянных броней.")
         await state.clear()
         return
 
-    weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-
     # Показываем список постоянных броней для выбора
     buttons = []
     for pb in permanent_bookings:
-        days_text = ", ".join([weekday_names[d] for d in sorted(pb['weekdays'])])
+        days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(pb['weekdays'])])
         buttons.append([InlineKeyboardButton(
             text=f"{pb['place_name']} ({days_text})",
             callback_data=f"delete_perm_{pb['id']}"
@@ -2874,17 +3359,16 @@ async def admin_delete_permanent_select(message: Message, state: FSMContext):
     )
 
     # 📅 Показываем календарь с постоянными бронями
-    all_bookings = db.get_user_bookings(user_id)
+    all_bookings = await run_db(db.get_user_bookings, user_id)
     permanent_dates = [b['date'] for b in all_bookings if b.get('booking_type') == 'permanent']
 
     if permanent_dates:
-        now = datetime.now()
+        today = date.today()
         await message.answer(
             f"📅 <b>Календарь постоянных броней пользователя {user_id}</b>\n\n"
             f"[15] — день с постоянной бронью\n\n"
             f"Красным выделены все даты, которые будут отменены при удалении постоянной брони.",
-            reply_markup=get_bookings_calendar_keyboard(now.year, now.month, permanent_dates),
-            parse_mode="HTML"
+            reply_markup=get_bookings_calendar_keyboard(today.year, today.month, permanent_dates)
         )
 
     await state.update_data(target_user_id=user_id)
@@ -2899,7 +3383,7 @@ async def admin_delete_permanent_confirm(callback: CallbackQuery, state: FSMCont
 
     permanent_id = int(callback.data.split("_")[2])
 
-    success = db.delete_permanent_booking(permanent_id)
+    success = await run_db(db.delete_permanent_booking, permanent_id)
 
     if success:
         await callback.message.edit_text(
@@ -2922,8 +3406,7 @@ async def admin_extend_permanent_start(callback: CallbackQuery, state: FSMContex
 
     await callback.message.answer(
         "🔄 <b>Продление постоянной брони</b>\n\n"
-        "Введите Telegram ID или @username пользователя:",
-        parse_mode="HTML"
+        "Введите Telegram ID или @username пользователя:"
     )
     await state.set_state(AdminStates.extend_permanent_user)
     await callback.answer()
@@ -2940,25 +3423,23 @@ async def admin_extend_permanent_select(message: Message, state: FSMContext):
     try:
         user_id = int(identifier)
     except ValueError:
-        user_id = db.find_user_by_username(identifier)
+        user_id = await run_db(db.find_user_by_username, identifier)
         if not user_id:
             await message.answer("❌ Пользователь не найден.")
             await state.clear()
             return
 
-    permanent_bookings = db.get_permanent_bookings(user_id)
+    permanent_bookings = await run_db(db.get_permanent_bookings, user_id)
 
     if not permanent_bookings:
         await message.answer(f"У пользователя {user_id} нет постоянных броней.")
         await state.clear()
         return
 
-    weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-
     # Показываем список постоянных броней для выбора
     buttons = []
     for pb in permanent_bookings:
-        days_text = ", ".join([weekday_names[d] for d in sorted(pb['weekdays'])])
+        days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(pb['weekdays'])])
         buttons.append([InlineKeyboardButton(
             text=f"{pb['place_name']} ({days_text})",
             callback_data=f"extend_perm_{pb['id']}"
@@ -2967,8 +3448,7 @@ async def admin_extend_permanent_select(message: Message, state: FSMContext):
     await message.answer(
         f"📌 <b>Постоянные брони пользователя {user_id}</b>\n\n"
         "Выберите бронь для продления:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
-        parse_mode="HTML"
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
     )
 
     await state.update_data(target_user_id=user_id)
@@ -2984,14 +3464,13 @@ async def admin_extend_permanent_show_details(callback: CallbackQuery, state: FS
     permanent_id = int(callback.data.split("_")[2])
 
     # Получаем детали брони
-    pb = db.get_permanent_booking_by_id(permanent_id)
+    pb = await run_db(db.get_permanent_booking_by_id, permanent_id)
 
     if not pb:
         await callback.answer("❌ Бронь не найдена", show_alert=True)
         return
 
-    weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-    days_text = ", ".join([weekday_names[d] for d in sorted(pb['weekdays'])])
+    days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(pb['weekdays'])])
 
     user_display = f"@{pb['username']}" if pb['username'] else pb['first_name']
 
@@ -3011,12 +3490,7 @@ async def admin_extend_permanent_show_details(callback: CallbackQuery, state: FS
         f"Старая бронь будет удалена, места освободятся.\n"
         f"Будут созданы новые брони на 90 дней вперёд.\n\n"
         f"Что хотите сделать?",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Продлить без изменений", callback_data="extend_confirm_same")],
-            [InlineKeyboardButton(text="🔧 Изменить место или дни", callback_data="extend_edit")],
-            [InlineKeyboardButton(text="❌ Отмена", callback_data="extend_cancel")]
-        ]),
-        parse_mode="HTML"
+        reply_markup=EXTEND_PERMANENT_KEYBOARD
     )
 
     await callback.answer()
@@ -3031,14 +3505,13 @@ async def admin_extend_confirm_same(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     permanent_id = data.get('permanent_id')
 
-    success = db.extend_permanent_booking(permanent_id)
+    success = await run_db(db.extend_permanent_booking, permanent_id)
 
     if success:
-        pb = db.get_permanent_bookings(data.get('user_id'))
+        pb = await run_db(db.get_permanent_bookings, data.get('user_id'))
         if pb:
             latest = pb[-1]  # Последняя созданная бронь
-            weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-            days_text = ", ".join([weekday_names[d] for d in sorted(latest['weekdays'])])
+            days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(latest['weekdays'])])
 
             await callback.message.edit_text(
                 f"✅ <b>Постоянная бронь продлена на 90 дней!</b>\n\n"
@@ -3046,16 +3519,14 @@ async def admin_extend_confirm_same(callback: CallbackQuery, state: FSMContext):
                 f"🪑 Место: {latest['place_name']}\n"
                 f"📅 Дни: {days_text}\n\n"
                 f"Старые брони отменены, места освобождены.\n"
-                f"Автоматически созданы новые брони на 90 дней.",
-                parse_mode="HTML"
+                f"Автоматически созданы новые брони на 90 дней."
             )
     else:
         await callback.message.edit_text(
             "❌ <b>Ошибка при продлении брони</b>\n\n"
             "Возможные причины:\n"
             "• Место уже занято на новые даты\n"
-            "• Конфликт с другими постоянными бронями",
-            parse_mode="HTML"
+            "• Конфликт с другими постоянными бронями"
         )
 
     await state.clear()
@@ -3071,15 +3542,7 @@ async def admin_extend_edit_start(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
 
     # Показываем карту офиса
-    if os.path.exists(OFFICE_MAP_PATH):
-        try:
-            photo = FSInputFile(OFFICE_MAP_PATH)
-            await callback.message.answer_photo(
-                photo=photo,
-                caption="🗺️ Карта офиса\n\nВыберите новое место или оставьте текущее"
-            )
-        except Exception as e:
-            logger.error(f"Error sending office map: {e}")
+    await send_office_map(callback.message, "🗺️ Карта офиса\n\nВыберите новое место или оставьте текущее")
 
     # Показываем все места для выбора
     all_places = list(range(1, TOTAL_PLACES + 1))
@@ -3088,8 +3551,7 @@ async def admin_extend_edit_start(callback: CallbackQuery, state: FSMContext):
         f"🪑 <b>Изменение места</b>\n\n"
         f"Текущее место: №{data.get('current_place_id')}\n\n"
         f"Выберите новое место или нажмите текущее чтобы оставить:",
-        reply_markup=get_places_keyboard(all_places),
-        parse_mode="HTML"
+        reply_markup=get_places_keyboard(all_places)
     )
 
     await state.set_state(AdminStates.extend_permanent_edit_place)
@@ -3109,14 +3571,13 @@ async def admin_extend_edit_days_toggle(callback: CallbackQuery, state: FSMConte
 
     if action == "confirm":
         if not selected:
-            await callback.answer("⚠️ Выберите хотя бы один день!", show_alert=True)
+            await callback.answer(NO_WEEKDAYS_TEXT, show_alert=True)
             return
 
         await state.update_data(new_weekdays=selected)
 
         # Показываем подтверждение
-        weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        days_text = ", ".join([weekday_names[d] for d in sorted(selected)])
+        days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(selected)])
 
         new_place = data.get('new_place_id')
         old_place = data.get('current_place_id')
@@ -3130,13 +3591,7 @@ async def admin_extend_edit_days_toggle(callback: CallbackQuery, state: FSMConte
             f"Старая бронь будет удалена, места освободятся.\n"
             f"Будут созданы новые брони на 90 дней вперёд.\n\n"
             f"Продлить с этими параметрами?",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="✅ Продлить", callback_data="extend_confirm_edited"),
-                    InlineKeyboardButton(text="❌ Отмена", callback_data="extend_cancel")
-                ]
-            ]),
-            parse_mode="HTML"
+            reply_markup=EXTEND_CONFIRM_KEYBOARD
         )
 
         await state.set_state(AdminStates.extend_permanent_confirm)
@@ -3163,7 +3618,7 @@ async def admin_extend_edit_days_toggle(callback: CallbackQuery, state: FSMConte
             reply_markup=get_weekday_keyboard(selected)
         )
         await callback.answer()
-    except:
+    except (ValueError, TelegramBadRequest):
         await callback.answer()
 
 
@@ -3178,11 +3633,10 @@ async def admin_extend_confirm_edited(callback: CallbackQuery, state: FSMContext
     new_place_id = data.get('new_place_id')
     new_weekdays = data.get('new_weekdays')
 
-    success = db.extend_permanent_booking(permanent_id, new_place_id, new_weekdays)
+    success = await run_db(db.extend_permanent_booking, permanent_id, new_place_id, new_weekdays)
 
     if success:
-        weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        days_text = ", ".join([weekday_names[d] for d in sorted(new_weekdays)])
+        days_text = ", ".join([WEEKDAY_NAMES[d] for d in sorted(new_weekdays)])
 
         await callback.message.edit_text(
             f"✅ <b>Постоянная бронь продлена на 90 дней!</b>\n\n"
@@ -3190,8 +3644,7 @@ async def admin_extend_confirm_edited(callback: CallbackQuery, state: FSMContext
             f"🪑 Место: №{new_place_id}\n"
             f"📅 Дни: {days_text}\n\n"
             f"Старые брони отменены, места освобождены.\n"
-            f"Автоматически созданы новые брони на 90 дней.",
-            parse_mode="HTML"
+            f"Автоматически созданы новые брони на 90 дней."
         )
     else:
         await callback.message.edit_text(
@@ -3199,8 +3652,7 @@ async def admin_extend_confirm_edited(callback: CallbackQuery, state: FSMContext
             "Возможные причины:\n"
             "• Место уже занято на новые даты\n"
             "• Конфликт с другими постоянными бронями\n"
-            "• Выбранные дни уже забронированы другим пользователем",
-            parse_mode="HTML"
+            "• Выбранные дни уже забронированы другим пользователем"
         )
 
     await state.clear()
@@ -3215,12 +3667,62 @@ async def admin_extend_cancel(callback: CallbackQuery, state: FSMContext):
 
 
 # Главная функция
+async def clear_calendar_cache_daily():
+    """В полночь сбрасываем календари прошедшего дня (ключ кэша содержит дату)"""
+    while True:
+        now = datetime.now()
+        next_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        await asyncio.sleep((next_midnight - now).total_seconds())
+        _build_calendar_keyboard.cache_clear()
+
+
+async def run_webhook():
+    """Приём апдейтов через вебхук: Telegram присылает их сам, без повторных запросов getUpdates"""
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    await bot.set_webhook(
+        f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+        drop_pending_updates=DROP_PENDING_UPDATES,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    logger.info("Webhook server listening on %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
+
+
 async def main():
-    dp.include_router(router)
-    await bot.delete_webhook(drop_pending_updates=True)
+    cache_task = asyncio.create_task(clear_calendar_cache_daily())
     logger.info("Бот запущен!")
-    await dp.start_polling(bot)
+    try:
+        if WEBHOOK_URL:
+            await run_webhook()
+        else:
+            # Оставшийся вебхук мешает getUpdates (Conflict) - снимаем его при каждом старте
+            await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+            # Длинный long poll: меньше пустых запросов getUpdates; только нужные типы апдейтов
+            await dp.start_polling(
+                bot,
+                polling_timeout=POLLING_TIMEOUT,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+    finally:
+        cache_task.cancel()
+        await storage.close()
+        db.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file